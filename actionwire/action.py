@@ -1,13 +1,34 @@
 from dataclasses import dataclass
-from time import sleep
+from typing import Callable, ClassVar
+from reactivex.abc import SchedulerBase
 from actionwire import config
 from actionwire.color import Color
+from actionwire.data_types import Match
+from actionwire.effect import Effect, engine, flash
 from actionwire.light import AbsLightController
 from actionwire.synchan import SynchanController
 from actionwire.utils import format_timecode, tc
 
 
+# Lower runs first when several actions wait for the same target
+PRIORITY_PLAYBACK = 0
+PRIORITY_LIGHT = 1
+PRIORITY_LOG = 2
+
+
 class Action:
+    priority: ClassVar[int] = PRIORITY_LIGHT
+    # A pending coalescing action may be folded into the next one of its device
+    coalesce: ClassVar[bool] = False
+    # Log category, rate limited separately by actionwire.log
+    category: ClassVar[str] = "action"
+    # The keyword match that fired this action right away, if any
+    trigger: Match | None = None
+
+    def device(self) -> object:
+        """The device this action talks to; actions of one device run in order."""
+        return None
+
     def do(self):
         pass
 
@@ -15,9 +36,35 @@ class Action:
         return f"{type(self).__name__}"
 
 
+class LightAction(Action):
+    """Action that updates the state of a light controller, then syncs it."""
+
+    controller: AbsLightController
+    duration: ClassVar[int] = 0
+
+    def device(self) -> object:
+        return self.controller
+
+    def update(self):
+        pass
+
+    def apply(self):
+        """Update the state of the controller, without syncing it."""
+        with self.controller.lock:
+            self.update()
+
+    def do(self):
+        self.apply()
+        # While effects play, the next frame shows the new state
+        if not self.controller.animated:
+            self.controller.sync(self.duration)
+
+
 @dataclass
 class PrintAction(Action):
     text: str
+    category: ClassVar[str] = "print"
+    priority: ClassVar[int] = PRIORITY_LOG
 
     def __str__(self) -> str:
         return f"{type(self).__name__}: {self.text}"
@@ -26,22 +73,29 @@ class PrintAction(Action):
         pass
 
 
+class TimecodePrintAction(PrintAction):
+    """The playhead position, logged at the rate of its own category."""
+
+    category: ClassVar[str] = "timecode"
+
+
 @dataclass
-class ResetAction(Action):
+class ResetAction(LightAction):
     controller: AbsLightController
 
     def __str__(self) -> str:
         return f"{type(self).__name__}: Reset {self.controller}"
 
-    def do(self):
+    def update(self):
+        # The bulbs may have been changed outside the show, resend everything
+        self.controller.invalidate()
         self.controller.change_color(config.INITIAL_COLOR)
         self.controller.set_brightness(config.initial_brightness)
         self.controller.set_power(False)
-        self.controller.sync(0)
 
 
 @dataclass
-class TurnOnAction(Action):
+class TurnOnAction(LightAction):
     controller: AbsLightController
     color: Color | None = None
     brightness: int | None = None
@@ -49,83 +103,115 @@ class TurnOnAction(Action):
     def __str__(self) -> str:
         return f"{type(self).__name__}: Turn on {self.controller}"
 
-    def do(self):
+    def update(self):
         self.controller.set_power(True)
         if self.color:
             self.controller.change_color(self.color)
         if self.brightness:
             self.controller.set_brightness(self.brightness)
-        self.controller.sync(0)
 
 
 @dataclass
-class BrightnessAction(Action):
+class BrightnessAction(LightAction):
     controller: AbsLightController
     diff: int
+    duration: ClassVar[int] = 200
+    coalesce: ClassVar[bool] = True
 
     def __str__(self) -> str:
         return f"{type(self).__name__}: Change brightness of {self.controller}"
 
-    def do(self):
+    def update(self):
         self.controller.adjust_brightness(self.diff)
-        self.controller.sync(200)
+
+
+@dataclass
+class EffectAction(Action):
+    """Play an effect on the controller (see actionwire.effect).
+
+    `effect` is called with the color of the controller when the action
+    runs. `do` returns immediately; the engine of `scheduler` renders the
+    effect, blended with the others playing on the controller.
+    """
+
+    controller: AbsLightController
+    effect: Callable[[Color], Effect]
+    scheduler: SchedulerBase | None = None
+
+    def __str__(self) -> str:
+        return f"{type(self).__name__}: Effect on {self.controller}"
+
+    def device(self) -> object:
+        return self.controller
+
+    def do(self):
+        engine(self.scheduler).play(self.controller, self.effect(self.controller.color))
 
 
 @dataclass
 class FlashAction(Action):
+    """Flash the controller for `length` seconds.
+
+    The flash is an effect over the brightness of the controller, which it
+    never changes: overlapping flashes, or a color change during one, all
+    end on the current state of the light.
+    """
+
     controller: AbsLightController
     length: float = 0.5
+    scheduler: SchedulerBase | None = None
 
     def __str__(self) -> str:
         return f"{type(self).__name__}: Flash of {self.controller}"
 
+    def device(self) -> object:
+        return self.controller
+
     def do(self):
-        original = self.controller.color.brightness
-        new_brightness = (
-            config.MAX_BRIGHTNESS if original < 50000 else config.MIN_BRIGHTNESS
+        engine(self.scheduler).play(
+            self.controller, flash(self.controller.color, self.length)
         )
-        self.controller.set_brightness(new_brightness)
-        self.controller.sync(200)
-        sleep(self.length)
-        self.controller.set_brightness(original)
-        self.controller.sync(200)
 
 
 @dataclass
-class ColorAction(Action):
+class ColorAction(LightAction):
     controller: AbsLightController
     color: Color
     diff: int
+    duration: ClassVar[int] = 500
+    coalesce: ClassVar[bool] = True
 
     def __str__(self) -> str:
         return f"{type(self).__name__}: Change color of {self.controller} to {self.color}, {self.diff}"
 
-    def do(self):
+    def update(self):
         self.controller.change_color(self.color)
         self.controller.adjust_brightness(self.diff)
-        self.controller.sync(500)
 
 
 @dataclass
-class SwapColorAction(Action):
+class SwapColorAction(LightAction):
     controller: AbsLightController
     colors: list[Color]
+    duration: ClassVar[int] = 500
+    coalesce: ClassVar[bool] = True
 
     def __str__(self) -> str:
         return (
             f"{type(self).__name__}: Swap color of {self.controller} to {self.colors}"
         )
 
-    def do(self):
+    def update(self):
         old_color = self.controller.color
         for color in self.colors:
             if color.name != old_color.name:
                 self.controller.change_color(color)
-                self.controller.sync(500)
                 break
 
 
 class SeekAction(Action):
+    priority: ClassVar[int] = PRIORITY_PLAYBACK
+
     def __init__(self, controller: SynchanController, target: int | str) -> None:
         super().__init__()
         self.controller: SynchanController = controller
@@ -137,6 +223,8 @@ class SeekAction(Action):
     def __str__(self) -> str:
         return f"{type(self).__name__}: Seek playhead to {format_timecode(self.target)}"
 
+    def device(self) -> object:
+        return self.controller
+
     def do(self):
-        self.controller.seek(self.target)
-        self.controller.play()
+        self.controller.seek_and_play(self.target)
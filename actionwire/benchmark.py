@@ -0,0 +1,321 @@
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+import wave
+
+# Runs in a fresh interpreter and prints the elapsed seconds of each phase
+STARTUP = """
+import time
+t0 = time.perf_counter()
+from actionwire import config, main, voice_detection
+t_import = time.perf_counter()
+mode, arg = {mode!r}, {arg!r}
+if mode == "csv":
+    main.from_csv(lambda keywords: None)
+elif mode == "file":
+    main.from_audio_file(arg, lambda keywords: None)
+else:
+    main.from_mic(lambda keywords: None)
+t_pipeline = time.perf_counter()
+t_model = t_pipeline
+if mode != "csv":
+    voice_detection.prepare_recognizer(config.model_samplerate).result()
+    t_model = time.perf_counter()
+print(t_import - t0, t_pipeline - t0, t_model - t0)
+"""
+
+
+def startup(mode: str, file: str | None, repeat: int) -> dict:
+    """Time import, pipeline construction and recognizer readiness of a mode."""
+    samples: dict[str, list[float]] = {"import": [], "pipeline": [], "model": []}
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", STARTUP.format(mode=mode, arg=file)],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        phases = [float(t) for t in out.strip().splitlines()[-1].split()]
+        for key, t in zip(samples, phases):
+            samples[key].append(t)
+    return {
+        "mode": mode,
+        **{key: statistics.median(values) for key, values in samples.items()},
+    }
+
+
+def recognizer_cpu(file: str, vad: bool, resample: bool = False) -> dict:
+    """CPU seconds spent decoding a WAV file, with or without the VAD gate.
+
+    With `resample`, the audio is first converted to the model rate, and the
+    CPU of the resampler is counted in.
+    """
+    import numpy as np
+
+    from actionwire import config, voice_detection
+    from actionwire.resample import PolyphaseResampler
+
+    with wave.open(file, "rb") as wf:
+        framerate = wf.getframerate()
+        seconds = wf.getnframes() / framerate
+        blocks = [
+            wf.readframes(config.blocksize)
+            for _ in range(0, wf.getnframes(), config.blocksize)
+        ]
+
+    resampler = None
+    rate = framerate
+    if resample and framerate != config.model_samplerate:
+        resampler = PolyphaseResampler(framerate, config.model_samplerate)
+        rate = config.model_samplerate
+    rec = voice_detection.prepare_recognizer(rate).result()
+    gate = voice_detection.EnergyGate(rate) if vad else None
+    words = 0
+    resampler_cpu = 0.0
+    start = time.process_time()
+    for block in blocks:
+        if resampler:
+            t = time.process_time()
+            block = resampler.process(np.frombuffer(block, dtype=np.int16)).tobytes()
+            resampler_cpu += time.process_time() - t
+        for item in gate.process(block) if gate else [block]:
+            if not isinstance(item, int) and voice_detection.accept_waveform(rec, item):
+                words += len(json.loads(rec.Result()).get("result", []))
+    words += len(json.loads(rec.FinalResult()).get("result", []))
+    cpu = time.process_time() - start
+    return {
+        "vad": vad,
+        "recognizer_rate": rate,
+        "audio_seconds": seconds,
+        "cpu_seconds": cpu,
+        "cpu_per_audio_second": cpu / seconds,
+        "resampler_cpu_per_audio_second": resampler_cpu / seconds,
+        "words": words,
+        "skipped_seconds": gate.skipped_total / rate if gate else 0.0,
+    }
+
+
+def _legacy_detection_stream(source):
+    """The detection pipeline before it was fused, as a baseline."""
+    import reactivex as rx
+    import reactivex.operators as ops
+    from reactivex.scheduler import ImmediateScheduler
+
+    from actionwire.data_types import Detection
+    from actionwire.voice_detection import high_confidence
+
+    return source.pipe(
+        ops.flat_map(
+            lambda result: rx.from_list(result["result"], scheduler=ImmediateScheduler())
+            if "result" in result
+            else rx.empty()
+        ),
+        ops.filter(lambda word: word["word"] != "[unk]"),
+        ops.filter(high_confidence),
+        ops.map(
+            lambda word: Detection(
+                start=word["start"], word=word["word"], confidence=word["conf"]
+            )
+        ),
+    )
+
+
+def detections(results: int) -> list[dict]:
+    """Time and allocated memory per Vosk result of the legacy and the fused
+    detection stage, on synthetic results of five words."""
+    import reactivex as rx
+
+    from actionwire.voice_detection import create_detection_stream
+
+    words = ["自己", "[unk]", "喝", "这", "醒来"]
+    source = [
+        {
+            "result": [
+                {"word": w, "start": i + j * 0.2, "end": i + j * 0.2 + 0.2, "conf": 0.9}
+                for j, w in enumerate(words)
+            ]
+        }
+        for i in range(results)
+    ]
+
+    reports = []
+    for name, stage in (
+        ("legacy", _legacy_detection_stream),
+        ("fused", create_detection_stream),
+    ):
+        out: list = []
+        start = time.perf_counter()
+        stage(rx.from_list(source)).subscribe(out.append)
+        elapsed = time.perf_counter() - start
+
+        tracemalloc.start()
+        stage(rx.from_list(source)).subscribe(lambda _: None)
+        _, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        allocated = sum(stat.size for stat in snapshot.statistics("filename"))
+        tracemalloc.stop()
+        reports.append(
+            {
+                "stage": name,
+                "detections": len(out),
+                "us_per_result": elapsed / results * 1e6,
+                "peak_bytes": peak,
+                "retained_bytes": allocated,
+            }
+        )
+    return reports
+
+
+def _percentiles(values: list[float]) -> dict:
+    import numpy as np
+
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"count": len(values), "p50": p50, "p95": p95, "p99": p99}
+
+
+def latency(file: str, playhead: float, low_latency: bool, vad: bool) -> dict:
+    """Keyword-to-command latency over a real-time replay of a WAV file.
+
+    The file goes through `main.from_audio_file` at real-time pace into
+    `create_events`, with fake lights and Synchan. An action counts for a
+    keyword when it carries the match as its trigger, so delayed follow-ups
+    like the tea seek-back are not counted. Its latency runs from the end of
+    the spoken keyword to the first command of its device after it.
+    """
+    from threading import Event
+
+    import reactivex as rx
+    import reactivex.operators as ops
+
+    from actionwire import config, main
+    from actionwire.executor import ActionExecutor
+    from actionwire.fake_devices import (
+        CommandRecorder,
+        FakeLightController,
+        FakeSynchanController,
+    )
+    from actionwire.logic import create_events
+    from actionwire.synchan import SynchanState
+
+    recorder = CommandRecorder()
+    executor = ActionExecutor()
+    done = Event()
+    started: list[float] = []
+
+    def submit(action):
+        match = action.trigger
+        device = action.device()
+        if match is not None and device is not None:
+            spoken = started[0] + match.end
+            recorder.expect(device, match.word, type(action).__name__, spoken)
+        executor.submit(action)
+
+    def cb(keywords):
+        lights = [
+            FakeLightController(
+                recorder,
+                name=name,
+                color=config.YELLOW,
+                brightness=config.initial_brightness,
+            )
+            for name in ("P", "W")
+        ]
+        synchan_stream = rx.interval(config.playhead_interval).pipe(
+            ops.map(
+                lambda i: SynchanState(
+                    True, playhead + i * config.playhead_interval, 1e9, False, 0.0
+                )
+            ),
+            ops.share(),
+        )
+        conf = config.Config("fake", [], [], {}, False)
+        keywords = keywords.pipe(ops.do_action(on_completed=done.set))
+        started.append(time.monotonic())
+        synchan = FakeSynchanController(recorder)
+        create_events(keywords, synchan_stream, *lights, synchan, conf).subscribe(
+            on_next=submit, on_error=print
+        )
+
+    main.from_audio_file(file, cb, low_latency, vad=vad, realtime=True)
+    done.wait()
+    time.sleep(1)  # let the device queues drain
+
+    if not recorder.samples:
+        raise RuntimeError(f"No keyword reached a device in {file}")
+
+    by_keyword: dict[str, list[float]] = {}
+    by_action: dict[str, list[float]] = {}
+    for sample in recorder.samples:
+        by_keyword.setdefault(sample["keyword"], []).append(sample["latency"])
+        by_action.setdefault(sample["action"], []).append(sample["latency"])
+    return {
+        "file": file,
+        "low_latency": low_latency,
+        "vad": vad,
+        "keywords": {k: _percentiles(v) for k, v in by_keyword.items()},
+        "actions": {k: _percentiles(v) for k, v in by_action.items()},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmarks of the actionwire pipeline"
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    startup_parser = sub.add_parser("startup", help="Start-up time per mode")
+    startup_parser.add_argument(
+        "--mode", choices=["file", "mic", "csv"], action="append"
+    )
+    startup_parser.add_argument("-f", help="Audio file for the file mode")
+    startup_parser.add_argument("-n", "--repeat", type=int, default=5)
+
+    vad_parser = sub.add_parser("vad", help="Recognizer CPU with and without VAD")
+    vad_parser.add_argument("-f", required=True, help="WAV file, mono int16")
+
+    resample_parser = sub.add_parser(
+        "resample", help="Recognizer CPU at the file rate and at the model rate"
+    )
+    resample_parser.add_argument("-f", required=True, help="WAV file, mono int16")
+    resample_parser.add_argument("--vad", action="store_true")
+
+    detections_parser = sub.add_parser(
+        "detections", help="Vosk result to Detection stage, legacy vs fused"
+    )
+    detections_parser.add_argument("-n", "--results", type=int, default=20000)
+
+    latency_parser = sub.add_parser(
+        "latency", help="Keyword-to-command latency with fake devices"
+    )
+    latency_parser.add_argument(
+        "fixtures", nargs="+", help="WAV files, mono int16"
+    )
+    latency_parser.add_argument(
+        "--playhead", type=float, default=60, help="Film time at the start, seconds"
+    )
+    latency_parser.add_argument("--low-latency", action="store_true")
+    latency_parser.add_argument("--vad", action="store_true")
+
+    args = parser.parse_args()
+
+    if args.command == "startup":
+        modes = args.mode or (["csv", "file", "mic"] if args.f else ["csv", "mic"])
+        for mode in modes:
+            print(json.dumps(startup(mode, args.f, args.repeat)))
+    elif args.command == "vad":
+        for vad in (False, True):
+            print(json.dumps(recognizer_cpu(args.f, vad)))
+    elif args.command == "resample":
+        for resample in (False, True):
+            print(json.dumps(recognizer_cpu(args.f, args.vad, resample)))
+    elif args.command == "detections":
+        for report in detections(args.results):
+            print(json.dumps(report))
+    elif args.command == "latency":
+        for fixture in args.fixtures:
+            report = latency(fixture, args.playhead, args.low_latency, args.vad)
+            print(json.dumps(report, ensure_ascii=False))
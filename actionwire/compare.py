@@ -0,0 +1,281 @@
+import argparse
+import csv
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Iterable, Iterator
+
+import numpy as np
+
+from actionwire.utils import tc
+
+# Upper bounds of the time difference distribution, seconds
+DIFF_BINS = (1, 3, 5, 10)
+# Detection rows matched per NumPy batch
+CHUNK_ROWS = 4096
+# Index key matching entries of every keyword
+ANY_KEYWORD = "*"
+
+
+@dataclass
+class ScriptEntry:
+    timecode: str
+    keyword: str
+    event: str
+    action: str
+
+
+def iter_script(path: str) -> Iterator[ScriptEntry]:
+    with open(path, "r", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            if row["timecode"] and row["keyword"]:  # Skip empty rows
+                yield ScriptEntry(
+                    row["timecode"],
+                    row["keyword"],
+                    row.get("event", ""),
+                    row.get("action", ""),
+                )
+
+
+def iter_detections(path: str) -> Iterator[tuple[str, str]]:
+    """(timecode, keyword) of every row, read lazily."""
+    with open(path, "r", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            if row["timecode"] and row["keyword"]:  # Skip empty rows
+                yield row["timecode"], row["keyword"]
+
+
+class ScriptIndex:
+    """Script entries in sorted time arrays, one per keyword.
+
+    Built once and shared by every detection file. `match` finds the closest
+    entry of each detection with one `searchsorted` per keyword and batch,
+    instead of scanning the whole script for every detection.
+    """
+
+    def __init__(self, entries: Iterable[ScriptEntry]):
+        self.entries = list(entries)
+        groups: dict[str, list[int]] = {ANY_KEYWORD: []}
+        for i, entry in enumerate(self.entries):
+            groups.setdefault(entry.keyword, []).append(i)
+            groups[ANY_KEYWORD].append(i)
+
+        seconds = np.array([tc(entry.timecode) for entry in self.entries])
+        self.times: dict[str, np.ndarray] = {}
+        self.ids: dict[str, np.ndarray] = {}
+        for keyword, ids in groups.items():
+            ids_array = np.array(ids, dtype=np.int64)
+            order = np.argsort(seconds[ids_array], kind="stable")
+            self.ids[keyword] = ids_array[order]
+            self.times[keyword] = seconds[ids_array][order]
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def match(
+        self, keyword: str, seconds: np.ndarray, tolerance: float
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Entry id (-1 when none within `tolerance`) and time difference of
+        the closest entry of `keyword` for each time in `seconds`."""
+        times = self.times.get(keyword)
+        if times is None or len(times) == 0:
+            return np.full(len(seconds), -1), np.full(len(seconds), np.inf)
+
+        entry_ids = self.ids[keyword]
+        right = np.searchsorted(times, seconds)
+        left = np.clip(right - 1, 0, len(times) - 1)
+        right = np.clip(right, 0, len(times) - 1)
+        # First of the entries sharing the time before, like `right` is
+        left = np.searchsorted(times, times[left])
+        left_diff = np.abs(times[left] - seconds)
+        right_diff = np.abs(times[right] - seconds)
+        # On a tie, the entry that comes first in the script wins
+        take_left = (left_diff < right_diff) | (
+            (left_diff == right_diff) & (entry_ids[left] < entry_ids[right])
+        )
+        closest = np.where(take_left, left, right)
+        diff = np.minimum(left_diff, right_diff)
+        ids = np.where(diff <= tolerance, entry_ids[closest], -1)
+        return ids, diff
+
+
+@dataclass
+class Report:
+    """Comparison of one detection file against the script."""
+
+    file: str
+    detections: int = 0
+    matched: int = 0
+    diff_sum: float = 0.0
+    diff_max: float = 0.0
+    diff_bins: list[int] = field(default_factory=lambda: [0] * (len(DIFF_BINS) + 1))
+    script_hits: np.ndarray | None = None
+    pairs: list[tuple[str, str, int, float]] = field(default_factory=list)
+    unmatched: list[tuple[str, str]] = field(default_factory=list)
+
+    @property
+    def missed(self) -> int:
+        """Script entries no detection matched."""
+        if self.script_hits is None:
+            return 0
+        return int(np.count_nonzero(self.script_hits == 0))
+
+    @property
+    def recall(self) -> float:
+        if self.script_hits is None or len(self.script_hits) == 0:
+            return 0.0
+        return 1 - self.missed / len(self.script_hits)
+
+    @property
+    def diff_mean(self) -> float:
+        return self.diff_sum / self.matched if self.matched else 0.0
+
+    def row(self) -> list:
+        return [
+            self.file,
+            self.detections,
+            self.matched,
+            self.detections - self.matched,
+            self.missed,
+            f"{self.recall:.3f}",
+            f"{self.diff_mean:.2f}",
+            self.diff_max,
+            *self.diff_bins,
+        ]
+
+
+SUMMARY_HEADER = [
+    "File",
+    "Detections",
+    "Matched",
+    "Unmatched Detections",
+    "Missed Script Entries",
+    "Recall",
+    "Mean Difference (s)",
+    "Max Difference (s)",
+    *[f"{low}-{high}s" for low, high in zip((0,) + DIFF_BINS, DIFF_BINS)],
+    f">{DIFF_BINS[-1]}s",
+]
+
+
+def compare(
+    index: ScriptIndex,
+    rows: Iterable[tuple[str, str]],
+    file: str = "",
+    tolerance: float = 10,
+    any_keyword: bool = False,
+    details: bool = False,
+) -> Report:
+    """Match detection rows against the script, in batches of CHUNK_ROWS.
+
+    Detections match the closest script entry of the same keyword, or of any
+    keyword with `any_keyword` (the behaviour of tests/compare_csv.py). With
+    `details`, the report keeps every matched and unmatched detection.
+    """
+    report = Report(file, script_hits=np.zeros(len(index), dtype=np.int64))
+    rows = iter(rows)
+    while chunk := list(islice(rows, CHUNK_ROWS)):
+        report.detections += len(chunk)
+        by_keyword: dict[str, list[int]] = {}
+        for i, (_, keyword) in enumerate(chunk):
+            by_keyword.setdefault(ANY_KEYWORD if any_keyword else keyword, []).append(i)
+        seconds = np.array([tc(timecode) for timecode, _ in chunk])
+
+        for keyword, positions in by_keyword.items():
+            ids, diffs = index.match(keyword, seconds[positions], tolerance)
+            hit = ids >= 0
+            hit_diffs = diffs[hit]
+            report.matched += int(np.count_nonzero(hit))
+            report.diff_sum += float(hit_diffs.sum())
+            if len(hit_diffs):
+                report.diff_max = max(report.diff_max, float(hit_diffs.max()))
+            bins = np.searchsorted(DIFF_BINS, hit_diffs, side="left")
+            for b, count in zip(*np.unique(bins, return_counts=True)):
+                report.diff_bins[b] += int(count)
+            np.add.at(report.script_hits, ids[hit], 1)
+
+            if details:
+                for position, entry_id, diff in zip(positions, ids, diffs):
+                    timecode, detected = chunk[position]
+                    if entry_id >= 0:
+                        report.pairs.append(
+                            (timecode, detected, int(entry_id), float(diff))
+                        )
+                    else:
+                        report.unmatched.append((timecode, detected))
+    return report
+
+
+def export_details(report: Report, index: ScriptIndex, output_file: str):
+    """Write the matched pairs of a report, like tests/compare_csv.py does."""
+    with open(output_file, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(
+            [
+                "Detection Timecode",
+                "Detection Keyword",
+                "Script Timecode",
+                "Script Keyword",
+                "Time Difference (s)",
+                "Script Event",
+                "Script Action",
+            ]
+        )
+        for timecode, keyword, entry_id, diff in report.pairs:
+            entry = index.entries[entry_id]
+            writer.writerow(
+                [
+                    timecode,
+                    keyword,
+                    entry.timecode,
+                    entry.keyword,
+                    int(diff) if diff.is_integer() else diff,
+                    entry.event,
+                    entry.action,
+                ]
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Score detection files of rehearsals against script.csv"
+    )
+    parser.add_argument("detections", nargs="+", help="detections.csv files")
+    parser.add_argument("--script", default="data/script.csv")
+    parser.add_argument(
+        "--output", default="comparison_summary.csv", help="One row per file"
+    )
+    parser.add_argument(
+        "--tolerance", type=float, default=10, help="Seconds between matches"
+    )
+    parser.add_argument(
+        "--any-keyword",
+        action="store_true",
+        help="Match the closest script entry whatever its keyword",
+    )
+    parser.add_argument(
+        "--details", help="Write the matches of each file to DETAILS_<n>.csv"
+    )
+    args = parser.parse_args()
+
+    index = ScriptIndex(iter_script(args.script))
+    with open(args.output, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(SUMMARY_HEADER)
+        for n, path in enumerate(args.detections):
+            report = compare(
+                index,
+                iter_detections(path),
+                path,
+                args.tolerance,
+                args.any_keyword,
+                details=args.details is not None,
+            )
+            writer.writerow(report.row())
+            if args.details:
+                export_details(report, index, f"{args.details}_{n}.csv")
+            print(
+                f"{path}: {report.matched}/{report.detections} matched, "
+                f"recall {report.recall:.3f}, "
+                f"mean difference {report.diff_mean:.2f}s"
+            )
+    print(f"Summary written to {args.output}")
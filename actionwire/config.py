@@ -1,17 +1,86 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import json
 import multiprocessing
-from reactivex.scheduler import ThreadPoolScheduler
-import sounddevice as sd
-from vosk import os  # type: ignore
+import os
+from threading import RLock
+from typing import Any
+from reactivex.scheduler import NewThreadScheduler, ThreadPoolScheduler
 from actionwire.color import Color
+from actionwire.utils import TimecodeIndex
 
-device_info = sd.query_devices(kind="input")
-# soundfile expects an int, sounddevice provides a float:
-samplerate = int(device_info["default_samplerate"])
+# Audio frames per block fed to the recognizer
+blocksize = 8000
+# Smaller blocks for the low-latency mode, which fires on partial results
+low_latency_blocksize = 1600
+# Voice activity gate: RMS of a 10 ms frame of int16 speech, seconds the
+# gate stays open after speech, and seconds of audio replayed before speech
+vad_threshold = 500
+vad_hangover = 1.0
+vad_preroll = 0.5
+# Sample rate of the Vosk model; other audio is resampled to it first
+model_samplerate = 16000
+# Audio blocks buffered between the microphone and the recognizer
+ring_blocks = 32
+# Mics listened to at once, as "device" or "device:channel" (sounddevice
+# name or index, channels from 1); empty for the default input only
+mics: list[str] = []
+# Seconds a detection is held to merge the mics in time order, and seconds
+# within which the same word from two mics is one detection
+mic_merge_hold = 0.3
+mic_dedup_window = 0.5
+
+# Seconds between two writes of the log, lines kept until then, and lines
+# per second allowed for each category (others are not limited)
+log_interval = 0.2
+log_capacity = 10000
+log_rates = {
+    "timecode": 1.0,
+    "keyword": 20.0,
+    "action": 50.0,
+    "light": 5.0,
+    "error": 5.0,
+}
 
 thread_count = multiprocessing.cpu_count()
-thread_pool_scheduler = ThreadPoolScheduler(thread_count)
+# Each mic of a MicArray blocks its thread for the whole show, so every one
+# gets its own thread instead of a worker of the thread pool
+source_scheduler = NewThreadScheduler()
+
+# device_info, samplerate and thread_pool_scheduler are created on first use
+# (see __getattr__), so importing config needs no audio device
+_lazy_lock = RLock()
+
+
+def _device_info() -> Any:
+    import sounddevice as sd  # type: ignore
+
+    return sd.query_devices(kind="input")
+
+
+def _samplerate() -> int:
+    # soundfile expects an int, sounddevice provides a float:
+    return int(__getattr__("device_info")["default_samplerate"])
+
+
+def _thread_pool_scheduler() -> ThreadPoolScheduler:
+    return ThreadPoolScheduler(thread_count)
+
+
+_lazy = {
+    "device_info": _device_info,
+    "samplerate": _samplerate,
+    "thread_pool_scheduler": _thread_pool_scheduler,
+}
+
+
+def __getattr__(name: str) -> Any:
+    if name not in _lazy:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _lazy_lock:
+        if name not in globals():
+            globals()[name] = _lazy[name]()
+    return globals()[name]
+
 
 keywords = [
     "喝茶",
@@ -22,6 +91,8 @@ keywords = [
     "转换",
     "就像你",
 ]
+# Seconds within which all the parts of a keyword must be detected
+match_window = 3
 
 MAX_BRIGHTNESS = 65535
 MIN_BRIGHTNESS = 10000
@@ -29,6 +100,12 @@ MIN_BRIGHTNESS = 10000
 initial_brightness = 40000
 brightness_step = 10000
 
+# Seconds to wait for each bulb of a group to acknowledge a command
+light_timeout = 0.5
+# Frames per second of light effects; LIFX bulbs take up to 20 messages a
+# second each
+effect_fps = 20
+
 # Hue, Saturation, Brightness, Kelvin
 RED = Color("RED", [65535, 65535, 65535, 3500])
 ORANGE = Color("ORANGE", [6500, 65535, 65535, 3500])
@@ -45,7 +122,64 @@ GOLD = Color("GOLD", [58275, 0, 65535, 2500])
 
 INITIAL_COLOR = YELLOW
 
+# Keyword rules of the show. A rule fires on a match of `keyword` and on
+# the cues of `timecode`, only while the playhead is inside one of its
+# `windows` (open ends are null), at most once per `throttle` seconds.
+# Brightness steps are multiples of brightness_step; with `alternate`, the
+# P and W lights trade places every other firing. See actionwire/rule.py.
+rules: list[dict[str, Any]] = [
+    {
+        "keyword": "自己",
+        "timecode": "自己",
+        "throttle": 3,
+        "actions": [{"do": "flash", "light": "p", "length": 0.4}],
+    },
+    {
+        "keyword": "醒来",
+        "timecode": "醒來",
+        "alternate": True,
+        "actions": [
+            {"do": "color", "light": "w", "color": "YELLOW", "steps": -1},
+            {"do": "color", "light": "p", "color": "WHITE", "steps": 1},
+        ],
+    },
+    {
+        "keyword": "转换",
+        "timecode": "轉換",
+        "alternate": True,
+        "actions": [
+            {"do": "color", "light": "w", "color": "YELLOW", "steps": -1},
+            {"do": "color", "light": "p", "color": "ORANGE", "steps": 1},
+        ],
+    },
+    {
+        "keyword": "就像你",
+        "timecode": "就像你",
+        "actions": [
+            {"do": "swap_color", "light": "p", "colors": ["WHITE", "YELLOW"]},
+            {"do": "swap_color", "light": "w", "colors": ["YELLOW", "WHITE"]},
+        ],
+    },
+    {
+        "keyword": "喝茶",
+        # 避免影片「喝這杯水」誤觸
+        "windows": [["00:30", None]],
+        "throttle": 15,
+        "actions": [
+            {"do": "seek", "to": "00:24"},
+            {"do": "brightness", "light": "p", "steps": -1},
+            {"do": "brightness", "light": "w", "steps": 1},
+            # 8 秒後跳回原位置
+            {"do": "seek", "to": "back", "delay": 8},
+            {"do": "brightness", "light": "p", "steps": 1, "delay": 8},
+            {"do": "brightness", "light": "w", "steps": -1, "delay": 8},
+        ],
+    },
+]
+
 # Synchan Settings
+# Seconds between two interpolated playhead positions
+playhead_interval = 0.1
 
 
 @dataclass
@@ -55,6 +189,12 @@ class Config:
     w_lights: list[tuple[str, str]]
     timecodes: dict[str, list[str]]
     enable_timecode: bool
+    rules: list[dict[str, Any]] = field(default_factory=lambda: rules)
+    cues: TimecodeIndex = field(init=False, repr=False)
+
+    def __post_init__(self):
+        # Compile the timecode tables once instead of on every Synchan tick
+        self.cues = TimecodeIndex(self.timecodes)
 
     def get_timecodes(self, key: str) -> list[str]:
         return self.timecodes[key] or []
@@ -69,6 +209,7 @@ def load_config(filename: str) -> Config:
             obj["w_lights"],
             obj["timecodes"],
             obj["enable_timecode"],
+            obj.get("rules", rules),
         )
 
 
@@ -1,51 +1,233 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
 import sys
 import threading
 import time
 import wave
+import numpy as np
 from reactivex import Observable, create
 from reactivex.abc import ObserverBase
-from reactivex.operators import flat_map, filter, map
 
-from actionwire import config, utils
-from actionwire.data_types import Match
-from actionwire.matching import KeywordScanner
-import voice_detection
-from shlex import join
+from actionwire import config, resample, store
+from actionwire.data_types import Detection
+from actionwire.matching import KeywordScanner, Matcher
+from actionwire.store import ShowStore
+from actionwire import voice_detection
 
 
-def create_from_audio(wf: wave.Wave_read) -> Observable[bytes]:
+def create_from_audio(
+    wf: wave.Wave_read, blocksize: int = config.blocksize, realtime: bool = False
+) -> Observable[bytes]:
+    """Blocks of a WAV file. With `realtime`, each block is emitted when it
+    would have been fully recorded by a microphone started at subscription."""
+
     def subscribe(observer: ObserverBase[bytes], scheduler=None):
         try:
+            start = time.monotonic()
+            framerate = wf.getframerate()
+            read = 0
             while True:
-                chunk = wf.readframes(8000)
+                chunk = wf.readframes(blocksize)
                 if len(chunk) == 0:
                     observer.on_completed()
                     break
+                read += len(chunk) // 2
+                if realtime:
+                    time.sleep(max(start + read / framerate - time.monotonic(), 0))
                 observer.on_next(chunk)
-                # Small delay to simulate real-time processing
         except Exception as e:
             observer.on_error(e)
 
     return create(subscribe)
 
+
+def create_from_file(
+    file: str, blocksize: int = config.blocksize, realtime: bool = False
+) -> Observable[bytes]:
+    """Like `create_from_audio`, but the file is opened for each subscription
+    and stays open until it has been read, on whatever thread reads it."""
+
+    def subscribe(observer: ObserverBase[bytes], scheduler=None):
+        with wave.open(file, "rb") as wf:
+            create_from_audio(wf, blocksize, realtime).subscribe(observer)
+
+    return create(subscribe)
+
+
+def find_cuts(
+    samples: np.ndarray, framerate: int, segment: float, search: float
+) -> list[int]:
+    """Split points roughly every `segment` seconds, moved to the quietest
+    10 ms frame within `search` seconds of each nominal point."""
+    frame = framerate // 100
+    n = len(samples) // frame
+    frames = samples[: n * frame].astype(np.float32).reshape(n, frame)
+    energy = np.square(frames).mean(axis=1)
+    step, reach = int(segment * 100), int(search * 100)
+    cuts = [0]
+    while cuts[-1] + step + reach < n:
+        lo = cuts[-1] + step - reach
+        cuts.append(lo + int(np.argmin(energy[lo : lo + 2 * reach])))
+    return [cut * frame for cut in cuts] + [len(samples)]
+
+
+_model = None
+
+
+def _load_model():
+    global _model
+    _model = voice_detection.load_model()
+
+
+def decode_segment(
+    file: str, start: int, end: int, own_start: int, own_end: int
+) -> list[dict]:
+    """Decode frames [start, end) of the file in a worker process.
+
+    Word times are shifted back to file time; only the words starting in
+    [own_start, own_end) are kept, the rest belong to the neighbour segment.
+    """
+    with wave.open(file, "rb") as wf:
+        framerate = wf.getframerate()
+        wf.setpos(start)
+        samples = np.frombuffer(wf.readframes(end - start), dtype=np.int16)
+
+    audio = resample.resample(samples, framerate, config.model_samplerate).tobytes()
+    rec = voice_detection.create_recognizer(_model, config.model_samplerate)
+    results = []
+    block = config.blocksize * 2  # int16 mono
+    for i in range(0, len(audio), block):
+        if rec.AcceptWaveform(audio[i : i + block]):
+            results.append(json.loads(rec.Result()))
+    results.append(json.loads(rec.FinalResult()))
+
+    offset = start / framerate
+    words = []
+    for result in results:
+        for word in result.get("result", []):
+            word["start"] += offset
+            word["end"] += offset
+            if own_start <= word["start"] * framerate < own_end:
+                words.append(word)
+    return words
+
+
+def decode_parallel(
+    file: str,
+    jobs: int | None = None,
+    segment: float = 60,
+    overlap: float = 2,
+    tolerance: float = 0.3,
+) -> list[dict]:
+    """Decode a WAV file in overlapping segments cut at silences, in a
+    process pool, and merge the words back into one time-ordered list."""
+    with wave.open(file, "rb") as wf:
+        framerate = wf.getframerate()
+        samples = np.frombuffer(wf.readframes(wf.getnframes()), dtype=np.int16)
+
+    cuts = find_cuts(samples, framerate, segment, search=segment / 10)
+    margin = int(overlap * framerate)
+    segments = [
+        (
+            file,
+            max(own_start - margin, 0),
+            min(own_end + margin, len(samples)),
+            own_start,
+            own_end,
+        )
+        for own_start, own_end in zip(cuts, cuts[1:])
+    ]
+
+    with ProcessPoolExecutor(jobs or os.cpu_count(), initializer=_load_model) as pool:
+        decoded = pool.map(decode_segment, *zip(*segments))
+        words = sorted(
+            (word for part in decoded for word in part), key=lambda w: w["start"]
+        )
+
+    merged: list[dict] = []
+    for word in words:
+        # A word at a cut may be recognized by both segments
+        if (
+            merged
+            and merged[-1]["word"] == word["word"]
+            and word["start"] - merged[-1]["start"] <= tolerance
+        ):
+            continue
+        merged.append(word)
+    return merged
+
+
+def record_detections(show: ShowStore, words: list[dict], source: str):
+    matcher = Matcher(KeywordScanner(config.keywords).automaton, config.match_window)
+    for word in words:
+        if word["word"] == "[unk]" or not voice_detection.high_confidence(word):
+            continue
+        match = matcher.match(Detection(word["start"], word["word"], word["conf"]))
+        if match is not None:
+            show.record_detection(match, source)
+
+
+def export_detections(show: ShowStore, path: str = "./data/detections.csv"):
+    """Keep detections.csv, the text export of the show, up to date."""
+    names, detections, _ = store.open_show(show.directory)
+    with open(path, "w") as f:
+        store.export_csv(names, detections, f)
+
+
 if __name__ == '__main__':
-    with wave.open(sys.argv[1], 'rb') as wf:
+    parser = argparse.ArgumentParser(
+        description="Convert an audio file to detections.csv"
+    )
+    parser.add_argument("file")
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Decode segments in this many processes (0: one per core)",
+    )
+    parser.add_argument(
+        "--show", help="Name of the show in the store (default: file and date)"
+    )
+    args = parser.parse_args()
+
+    source = os.path.basename(args.file)
+    show_name = args.show or (
+        f"{os.path.splitext(source)[0]}-{time.strftime('%Y%m%d-%H%M%S')}"
+    )
+    show = ShowStore(os.path.join(store.STORE_PATH, show_name))
+
+    with wave.open(args.file, 'rb') as wf:
         if wf.getnchannels() != 1 or wf.getsampwidth() != 2 or wf.getcomptype() != "NONE":
             print("Audio file must be WAV format mono PCM.")
             sys.exit(1)
 
+        if args.jobs != 1:
+            words = decode_parallel(args.file, args.jobs or None)
+            record_detections(show, words, source)
+            show.close()
+            export_detections(show)
+            sys.exit(0)
+
         framerate = wf.getframerate()
         audio_stream = create_from_audio(wf)
         vosk_stream = audio_stream.pipe(
-            voice_detection.create_vosk(framerate=framerate),
+            resample.create_resampler(framerate),
+            voice_detection.create_vosk(framerate=config.model_samplerate),
         )
         detection_stream = voice_detection.create_detection_stream(vosk_stream)
         # detection_stream.subscribe(print)
 
-        with open("./data/detections.csv", "w") as f:
-            f.write("timecode,keyword\n")
-            scanner = KeywordScanner(config.keywords)
-            scanner.scan(detection_stream).pipe(
-                    map(Match.format_csv)
-                ).subscribe(f.write)
-            # input("Press enter to stop")
+        done = threading.Event()
+        scanner = KeywordScanner(config.keywords)
+        scanner.scan(detection_stream).subscribe(
+            lambda match: show.record_detection(match, source),
+            on_error=print,
+            on_completed=done.set,
+        )
+        done.wait()
+        show.close()
+        export_detections(show)
+        # input("Press enter to stop")
@@ -1,12 +1,23 @@
-
-import utils
+from actionwire import utils
 
 
 class Detection:
-    def __init__(self, start: float, word: str, confidence: float):
+    __slots__ = ("start", "word", "confidence", "latency", "end")
+
+    def __init__(
+        self,
+        start: float,
+        word: str,
+        confidence: float,
+        latency: float = 0.0,
+        end: float | None = None,
+    ):
         self.start = start
         self.word = word
         self.confidence = confidence
+        # Seconds of audio between the end of the word and its detection
+        self.latency = latency
+        self.end = start if end is None else end
 
     def __str__(self):
         return f"Detection({utils.format_timecode(self.start)}, {self.word}, conf: {self.confidence:.2f})"
@@ -15,12 +26,14 @@ class Detection:
         return f"{utils.format_timecode(self.start)},{self.word},{self.confidence}\n"
 
 class Match(Detection):
+    __slots__ = ()
+
     # def __init__(self, start: float, word: str):
     #     self.start = start
     #     self.word = word
 
     def __str__(self):
-        return f"Match({utils.format_timecode(self.start)}, {self.word}, conf: {self.confidence:.2f})"
+        return f"Match({utils.format_timecode(self.start)}, {self.word}, conf: {self.confidence:.2f}, latency: {self.latency:.2f}s)"
 
     # def format_csv(self):
     #     return f"{utils.format_timecode(self.start)},{self.word}"
@@ -0,0 +1,224 @@
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from threading import Lock
+from typing import Callable
+
+import numpy as np
+from reactivex.abc import DisposableBase, SchedulerBase
+
+from actionwire import config, metrics
+from actionwire.color import Color
+from actionwire.light import AbsLightController
+
+HUE, SATURATION, BRIGHTNESS, KELVIN = range(4)
+CHANNELS = {
+    "hue": HUE,
+    "saturation": SATURATION,
+    "brightness": BRIGHTNESS,
+    "kelvin": KELVIN,
+}
+UNDRIVEN = np.nan
+
+
+def curve(keyframes: list[tuple[float, float]], fps: float = config.effect_fps):
+    """Sample a piecewise linear curve through (seconds, value) keyframes at
+    `fps`, from 0 to the last keyframe."""
+    times, values = zip(*keyframes)
+    frames = int(round(times[-1] * fps)) + 1
+    return np.interp(np.arange(frames) / fps, times, values)
+
+
+@dataclass
+class Effect:
+    """HSBK targets and their weight, one row per frame.
+
+    Each frame the targets are mixed over what is under the effect (the
+    color of the controller and the effects started before it) by the
+    weight of the frame. Channels left UNDRIVEN (NaN) pass through. When the
+    effect ends, `commit` (if any) makes its result the controller color.
+    """
+
+    targets: np.ndarray
+    weights: np.ndarray
+    commit: Callable[[Color], Color] | None = None
+
+    def __len__(self) -> int:
+        return len(self.weights)
+
+
+def _targets(weights: np.ndarray, **channels: float) -> np.ndarray:
+    target = np.full(4, UNDRIVEN)
+    for name, value in channels.items():
+        target[CHANNELS[name]] = value
+    return np.broadcast_to(target, (len(weights), 4))
+
+
+def flash(
+    color: Color,
+    length: float,
+    transition: float = 0.2,
+    fps: float = config.effect_fps,
+) -> Effect:
+    """Full (or, on a bright light, low) brightness for `length` seconds."""
+    brightness = (
+        config.MAX_BRIGHTNESS if color.brightness < 50000 else config.MIN_BRIGHTNESS
+    )
+    weights = curve(
+        [(0, 0), (transition, 1), (length, 1), (length + transition, 0)], fps
+    )
+    return Effect(_targets(weights, brightness=brightness), weights)
+
+
+def fade(brightness: int, duration: float, fps: float = config.effect_fps) -> Effect:
+    """Brightness to `brightness`, which the light keeps afterwards."""
+    weights = curve([(0, 0), (duration, 1)], fps)
+    return Effect(
+        _targets(weights, brightness=brightness),
+        weights,
+        lambda color: color.set_brightness(brightness),
+    )
+
+
+def pulse(
+    brightness: int,
+    period: float,
+    count: int = 1,
+    fps: float = config.effect_fps,
+) -> Effect:
+    """`count` smooth swells to `brightness` and back, `period` seconds each."""
+    t = np.arange(int(round(period * count * fps)) + 1) / fps
+    weights = (1 - np.cos(2 * np.pi * t / period)) / 2
+    return Effect(_targets(weights, brightness=brightness), weights)
+
+
+def crossfade(color: Color, duration: float, fps: float = config.effect_fps) -> Effect:
+    """Hue, saturation and kelvin to those of `color`, which the light keeps
+    afterwards with its own brightness."""
+    weights = curve([(0, 0), (duration, 1)], fps)
+    return Effect(
+        _targets(
+            weights, hue=color.hue, saturation=color.saturation, kelvin=color.kelvin
+        ),
+        weights,
+        lambda current: current.change_color(color),
+    )
+
+
+def blend(under: np.ndarray, target: np.ndarray, weight: float) -> np.ndarray:
+    """Mix `target` over `under`; hue goes the short way around the circle."""
+    delta = target - under
+    delta[HUE] = (delta[HUE] + 32768) % 65536 - 32768
+    mixed = under + delta * weight
+    mixed[HUE] %= 65536
+    return np.where(np.isnan(target), under, mixed)
+
+
+class EffectEngine:
+    """Render the effects of every controller at a fixed frame rate.
+
+    Frames are due at fixed times from the start of a run and each effect
+    is sampled at the frame of its own elapsed time, so a late frame never
+    shifts the effects after it. Each frame blends all the effects of a
+    controller over its color and sends the result in one write per bulb,
+    only when it changed. The engine only runs while effects play; when the
+    last effect of a controller ends, the light syncs back to its color.
+    """
+
+    def __init__(
+        self,
+        scheduler: SchedulerBase | None = None,
+        fps: float = config.effect_fps,
+    ):
+        self._scheduler = scheduler
+        self.fps = fps
+        self.interval = timedelta(seconds=1 / fps)
+        self.playing: dict[AbsLightController, list[tuple[datetime, Effect]]] = {}
+        self.sent: dict[AbsLightController, list[int]] = {}
+        self.lock = Lock()
+        self.timer: DisposableBase | None = None
+        # Start of the current run, and when its next frame is due
+        self.origin: datetime | None = None
+        self.due: datetime | None = None
+
+    @property
+    def scheduler(self) -> SchedulerBase:
+        # Looked up on first use, like FlashAction does
+        return self._scheduler or config.thread_pool_scheduler
+
+    def play(self, controller: AbsLightController, effect: Effect):
+        with self.lock:
+            now = self.scheduler.now
+            self.playing.setdefault(controller, []).append((now, effect))
+            controller.animated = True
+            if self.timer is None:
+                self.origin = self.due = now
+                self.timer = self.scheduler.schedule(self._render)
+
+    def frame(
+        self, now: datetime
+    ) -> tuple[list[tuple[AbsLightController, list[int]]], list[AbsLightController]]:
+        """Frame codes that changed, and the controllers whose effects all
+        ended, at `now`."""
+        writes = []
+        finished = []
+        for controller, effects in list(self.playing.items()):
+            playing = []
+            for start, effect in effects:
+                i = int((now - start) / self.interval)
+                if i < len(effect):
+                    playing.append((start, effect, i))
+                elif effect.commit is not None:
+                    # Actions of the device queue change the color too
+                    with controller.lock:
+                        controller.set_color(effect.commit(controller.color))
+
+            if not playing:
+                del self.playing[controller]
+                self.sent.pop(controller, None)
+                controller.animated = False
+                finished.append(controller)
+                continue
+            self.playing[controller] = [(start, effect) for start, effect, _ in playing]
+
+            values = np.array(controller.color.code(), dtype=np.float64)
+            for _, effect, i in playing:
+                values = blend(values, effect.targets[i], effect.weights[i])
+            code = [int(v) for v in np.rint(values)]
+            code[HUE] %= 65536
+            if code != self.sent.get(controller):
+                self.sent[controller] = code
+                writes.append((controller, code))
+        return writes, finished
+
+    def _render(self, scheduler: SchedulerBase, _state=None):
+        with self.lock:
+            now = self.scheduler.now
+            writes, finished = self.frame(now)
+            if now - self.due >= self.interval:
+                metrics.effect_late_frames.inc()
+            if self.playing:
+                # The next frame after now, skipping the ones already missed
+                elapsed = int((now - self.origin) / self.interval)
+                self.due = self.origin + self.interval * (elapsed + 1)
+                self.timer = self.scheduler.schedule_absolute(self.due, self._render)
+            else:
+                self.timer = None
+
+        duration = int(self.interval.total_seconds() * 1000)
+        for controller, code in writes:
+            controller.show(code, duration)
+        metrics.effect_frames.inc()
+        for controller in finished:
+            controller.sync(duration)
+
+
+_engines: dict[SchedulerBase | None, EffectEngine] = {}
+_engines_lock = Lock()
+
+
+def engine(scheduler: SchedulerBase | None = None) -> EffectEngine:
+    """The engine of a scheduler (None for real time), shared by all actions."""
+    with _engines_lock:
+        if scheduler not in _engines:
+            _engines[scheduler] = EffectEngine(scheduler)
+        return _engines[scheduler]
@@ -0,0 +1,101 @@
+import heapq
+from itertools import count
+from threading import Condition, Lock, Thread
+import time
+from typing import Callable
+
+from actionwire import log, metrics
+from actionwire.action import Action, LightAction
+
+
+class DeviceQueue:
+    """Pending actions of one device, run in priority order by a worker thread.
+
+    When the worker takes a coalescing light action, every coalescing action
+    queued right behind it only updates the controller state; the light is
+    synced once, with the newest state.
+    """
+
+    def __init__(self, name: str, record: Callable[[Action], None] | None = None):
+        self.name = name
+        self.record = record
+        self.heap: list[tuple[int, int, float, Action]] = []
+        self.order = count()
+        self.condition = Condition()
+        self.thread = Thread(target=self._run, name=f"actions-{name}", daemon=True)
+        self.thread.start()
+
+    def put(self, action: Action):
+        with self.condition:
+            heapq.heappush(
+                self.heap,
+                (action.priority, next(self.order), time.perf_counter(), action),
+            )
+            self.condition.notify()
+
+    def _take(self) -> list[Action]:
+        with self.condition:
+            while not self.heap:
+                self.condition.wait()
+            _, _, submitted, action = heapq.heappop(self.heap)
+            self._observe_wait(action, submitted)
+            actions = [action]
+            while (
+                action.coalesce
+                and self.heap
+                and self.heap[0][0] == action.priority
+                and self.heap[0][3].coalesce
+            ):
+                _, _, submitted, stale = heapq.heappop(self.heap)
+                self._observe_wait(stale, submitted)
+                actions.append(stale)
+            return actions
+
+    def _observe_wait(self, action: Action, submitted: float):
+        metrics.action_wait_seconds.observe(
+            time.perf_counter() - submitted, action=type(action).__name__
+        )
+
+    def _run(self):
+        while True:
+            actions = self._take()
+            *stale, newest = actions
+            name = type(newest).__name__
+            try:
+                with metrics.action_seconds.time(action=name):
+                    for action in stale:
+                        if isinstance(action, LightAction):
+                            action.apply()
+                    newest.do()
+            except Exception as e:
+                metrics.action_failures.inc(action=name)
+                log.log("error", f"Action failed on {self.name}: {e}")
+                continue
+            if self.record is not None:
+                for action in actions:
+                    self.record(action)
+
+
+class ActionExecutor:
+    """Dispatch actions to one queue per device, so devices run in parallel."""
+
+    def __init__(self, record: Callable[[Action], None] | None = None):
+        self.queues: dict[object, DeviceQueue] = {}
+        self.lock = Lock()
+        # Called on the worker thread with every action that ran
+        self.record = record
+
+    def submit(self, action: Action):
+        device = action.device()
+        with self.lock:
+            queue = self.queues.get(device)
+            if queue is None:
+                queue = DeviceQueue(
+                    str(device) if device is not None else "log", self._record
+                )
+                self.queues[device] = queue
+        queue.put(action)
+
+    def _record(self, action: Action):
+        if self.record is not None:
+            self.record(action)
@@ -0,0 +1,73 @@
+from collections import defaultdict, deque
+from threading import Lock
+import time
+from typing import Callable
+
+from actionwire.light import AbsLightController
+from actionwire.synchan import SynchanController
+
+
+class CommandRecorder:
+    """Timestamps the commands the fake devices receive.
+
+    `expect` registers that a command is due on a device because of a
+    keyword; the next command the device receives resolves every expectation
+    waiting for it (several when actions were coalesced) into a latency
+    sample.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self.lock = Lock()
+        self.pending: dict[object, deque[tuple[str, str, float]]] = defaultdict(deque)
+        self.commands: list[tuple[float, str, str]] = []
+        self.samples: list[dict] = []
+
+    def expect(self, device: object, keyword: str, action: str, since: float):
+        with self.lock:
+            self.pending[device].append((keyword, action, since))
+
+    def command(self, device: object, name: str):
+        now = self.clock()
+        with self.lock:
+            self.commands.append((now, str(device), name))
+            waiting = self.pending[device]
+            while waiting:
+                keyword, action, since = waiting.popleft()
+                self.samples.append(
+                    {"keyword": keyword, "action": action, "latency": now - since}
+                )
+
+
+class FakeLightController(AbsLightController):
+    def __init__(self, recorder: CommandRecorder, **kwargs):
+        self.recorder = recorder
+        super().__init__(**kwargs)
+
+    def sync(self, duration: int = 0):
+        self.recorder.command(self, "sync")
+
+    def show(self, code: list[int], duration: int = 0):
+        self.recorder.command(self, "show")
+        self.confirmed_color = code
+
+
+class FakeSynchanController(SynchanController):
+    def __init__(self, recorder: CommandRecorder) -> None:
+        self.recorder = recorder
+        self.url = "fake"
+
+    def __str__(self) -> str:
+        return "Synchan"
+
+    def seek(self, to: int):
+        self.recorder.command(self, "seek")
+
+    def play(self):
+        self.recorder.command(self, "play")
+
+    def pause(self):
+        self.recorder.command(self, "pause")
+
+    def seek_and_play(self, to: int):
+        self.recorder.command(self, "seek_and_play")
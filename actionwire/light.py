@@ -1,7 +1,9 @@
-from actionwire import config
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from threading import Lock
+from actionwire import config, log, metrics
 from actionwire.color import Color
 from actionwire.config import WHITE
-from lifxlan import Light  # type:ignore
+from lifxlan import Light, LightSetColor, LightSetPower  # type:ignore
 
 
 class AbsLightController:
@@ -9,6 +11,14 @@ class AbsLightController:
         self.name: str = name
         self.color: Color = color
         self.power: bool = True
+        # Last state acknowledged by the device, None when unknown
+        self.confirmed_power: bool | None = None
+        self.confirmed_color: list[int] | None = None
+        # Set while the effect engine renders this light; syncs are left to it
+        self.animated: bool = False
+        # Held while the state is read and rewritten, by the actions of the
+        # device queue and by the effect engine
+        self.lock = Lock()
         self.set_brightness(brightness)
 
     def __str__(self) -> str:
@@ -29,39 +39,161 @@ class AbsLightController:
     def set_power(self, power: bool):
         self.power = power
 
+    def power_dirty(self) -> bool:
+        return self.power != self.confirmed_power
+
+    def color_dirty(self) -> bool:
+        return self.color.code() != self.confirmed_color
+
+    def is_dirty(self) -> bool:
+        return self.power_dirty() or self.color_dirty()
+
+    def invalidate(self):
+        """Forget the confirmed state so the next sync sends everything."""
+        self.confirmed_power = None
+        self.confirmed_color = None
+
     def sync(self, duration: int = 0):
         pass
 
+    def show(self, code: list[int], duration: int = 0):
+        """Send a frame of the effect engine without changing `color`."""
+        pass
+
 
 class LifxLightController(AbsLightController):
-    def __init__(self, addr: tuple[str, str], **kwargs):
+    def __init__(
+        self,
+        addr: tuple[str, str],
+        timeout: float = config.light_timeout,
+        **kwargs,
+    ):
         self.light: Light = Light(addr[0], addr[1])
+        self.timeout: float = timeout
         super().__init__(**kwargs)
         self.sync()
 
+    def _send(self, msg_type, payload: dict):
+        # One attempt with a socket timeout, so a call never hangs on a bulb
+        self.light.req_with_ack(msg_type, payload, timeout_secs=self.timeout)
+
+    def _send_power(self):
+        if self.power_dirty():
+            power_level = 65535 if self.power else 0
+            self._send(LightSetPower, {"power_level": power_level, "duration": 0})
+            self.confirmed_power = self.power
+
     def sync(self, duration: int = 0):
-        self.light.set_power(self.power, 0, False)
-        self.light.set_color(self.color.code(), duration=duration)
+        self._send_power()
+        if self.color_dirty():
+            code = self.color.code()
+            self._send(LightSetColor, {"color": code, "duration": duration})
+            self.confirmed_color = code
+
+    def show(self, code: list[int], duration: int = 0):
+        self._send_power()
+        self._send(LightSetColor, {"color": code, "duration": duration})
+        self.confirmed_color = code
 
 
 class GroupLightController(AbsLightController):
-    def __init__(self, addrs: list[tuple[str, str]], **kwargs):
+    def __init__(
+        self,
+        addrs: list[tuple[str, str]],
+        concurrent: bool = True,
+        timeout: float = config.light_timeout,
+        **kwargs,
+    ):
         self.lights: list[AbsLightController] = []
         for addr in addrs:
             try:
-                light = LifxLightController(addr, **kwargs)
+                light = LifxLightController(addr, timeout, **kwargs)
                 self.lights.append(light)
             except Exception as e:
                 print(f"Cannot connect to light: {addr}", e)
 
+        self.timeout: float = timeout
+        # One single-worker queue per bulb: the commands of a bulb run in
+        # order, and a slow bulb only holds up its own queue
+        self.workers: dict[AbsLightController, ThreadPoolExecutor] | None = (
+            {
+                light: ThreadPoolExecutor(1, thread_name_prefix="light")
+                for light in self.lights
+            }
+            if concurrent
+            else None
+        )
+        # Last sync and last frame submitted to each bulb
+        self.syncs: dict[AbsLightController, Future] = {}
+        self.frames: dict[AbsLightController, Future] = {}
         super().__init__(**kwargs)
         self.sync()
 
+    def invalidate(self):
+        super().invalidate()
+        for light in self.lights:
+            light.invalidate()
+
     def sync(self, duration: int = 0):
         for light in self.lights:
             light.set_color(self.color)
             light.set_power(self.power)
-            try:
+        # Bulbs already in the requested state need no packet at all, unless
+        # a frame still queued on them is about to change it; the sync is
+        # queued behind that frame
+        dirty = []
+        for light in self.lights:
+            frame = self.frames.pop(light, None)
+            if light.is_dirty() or (frame is not None and not frame.done()):
+                dirty.append(light)
+
+        if self.workers is None:
+            for light in dirty:
+                self._sync_light(light, duration)
+            return
+
+        futures = {}
+        for light in dirty:
+            pending = self.syncs.get(light)
+            if pending is None or pending.running() or pending.done():
+                pending = self.workers[light].submit(self._sync_light, light, duration)
+                self.syncs[light] = pending
+            # Otherwise a sync is still queued behind a busy bulb; it sends
+            # the state as it is when it runs, so at most one ever waits
+            futures[pending] = light
+        _, not_done = wait(futures, timeout=self.timeout)
+        for future in not_done:
+            metrics.light_sync_failures.inc(reason="timeout")
+            log.log(
+                "light", f"Light timed out after {self.timeout}s: {futures[future]}"
+            )
+
+    def show(self, code: list[int], duration: int = 0):
+        """Send the frame to every bulb without waiting. A bulb still busy
+        with the previous frame skips this one."""
+        for light in self.lights:
+            light.set_power(self.power)
+            if self.workers is None:
+                self._show_light(light, code, duration)
+                continue
+            pending = self.frames.get(light)
+            if pending is not None and not pending.done():
+                continue
+            self.frames[light] = self.workers[light].submit(
+                self._show_light, light, code, duration
+            )
+
+    def _show_light(self, light: AbsLightController, code: list[int], duration: int):
+        try:
+            light.show(code, duration)
+        except Exception as e:
+            metrics.light_sync_failures.inc(reason="error")
+            log.log("light", f"Cannot show frame on light: {light} {e}")
+
+    def _sync_light(self, light: AbsLightController, duration: int):
+        try:
+            with metrics.light_sync_seconds.time():
                 light.sync(duration)
-            except Exception as e:
-                print(f"Cannot sync light: {light}", e)
+        except Exception as e:
+            metrics.light_sync_failures.inc(reason="error")
+            log.log("light", f"Cannot sync light: {light} {e}")
@@ -0,0 +1,123 @@
+import atexit
+from collections import deque
+import sys
+from threading import Condition, Thread
+import time
+from typing import TextIO
+
+from actionwire import config, metrics
+
+
+class RateLimit:
+    """Token bucket allowing `rate` lines per second, in bursts of `burst`."""
+
+    def __init__(self, rate: float, now: float, burst: float | None = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1)
+        self.tokens = self.burst
+        self.updated = now
+
+    def allow(self, now: float) -> bool:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class LogSink:
+    """Log lines buffered in memory and written by a background thread.
+
+    `log` never touches the terminal: it checks the rate limit of the
+    category, appends the message to a bounded buffer and returns. Messages
+    are formatted with `str` on the writer thread, which flushes the buffer
+    every `interval` seconds. Lines over the rate of their category, or that
+    overflow the buffer, are dropped and counted; the writer reports how many.
+    """
+
+    def __init__(
+        self,
+        stream: TextIO | None = None,
+        rates: dict[str, float] | None = None,
+        interval: float = config.log_interval,
+        capacity: int = config.log_capacity,
+    ):
+        self.stream = stream
+        self.rates = config.log_rates if rates is None else rates
+        self.interval = interval
+        self.limits: dict[str, RateLimit] = {}
+        self.buffer: deque[tuple[float, str, object]] = deque()
+        self.capacity = capacity
+        self.dropped: dict[str, int] = {}
+        self.condition = Condition()
+        self.thread: Thread | None = None
+        self.closed = False
+
+    def log(self, category: str, message: object):
+        now = time.monotonic()
+        with self.condition:
+            if self.closed:
+                return
+            limit = self.limits.get(category)
+            if limit is None and category in self.rates:
+                limit = self.limits[category] = RateLimit(self.rates[category], now)
+            if limit is not None and not limit.allow(now):
+                self._drop(category, "rate")
+                return
+            if len(self.buffer) >= self.capacity:
+                self._drop(category, "overflow")
+                return
+            self.buffer.append((time.time(), category, message))
+            if self.thread is None:
+                self.thread = Thread(target=self._run, name="log", daemon=True)
+                self.thread.start()
+                atexit.register(self.close)
+
+    def _drop(self, category: str, reason: str):
+        self.dropped[category] = self.dropped.get(category, 0) + 1
+        metrics.log_dropped.inc(category=category, reason=reason)
+
+    def _run(self):
+        while True:
+            with self.condition:
+                self.condition.wait(self.interval)
+                closed = self.closed
+            self.flush()
+            if closed:
+                return
+
+    def flush(self):
+        with self.condition:
+            lines, self.buffer = self.buffer, deque()
+            dropped, self.dropped = self.dropped, {}
+        if not lines and not dropped:
+            return
+        stream = self.stream or sys.stdout
+        stream.write(
+            "".join(
+                f"{time.strftime('%H:%M:%S', time.localtime(at))} [{category}] {message}\n"
+                for at, category, message in lines
+            )
+        )
+        for category, count in dropped.items():
+            stream.write(f"[log] dropped {count} {category} lines\n")
+        stream.flush()
+
+    def close(self):
+        """Write what is buffered and stop the writer thread."""
+        with self.condition:
+            self.closed = True
+            thread = self.thread
+            self.condition.notify()
+        if thread is not None:
+            thread.join()
+        else:
+            self.flush()
+
+
+sink = LogSink()
+
+
+def log(category: str, message: object):
+    sink.log(category, message)
@@ -1,27 +1,28 @@
-from typing import Callable
 import reactivex as rx
 from reactivex.observable.observable import Observable
 import reactivex.operators as ops
+from reactivex.abc import SchedulerBase
 from actionwire import config
 from actionwire.action import (
     BrightnessAction,
-    FlashAction,
-    PrintAction,
     Action,
-    ColorAction,
     ResetAction,
     SeekAction,
-    SwapColorAction,
+    TimecodePrintAction,
     TurnOnAction,
 )
 from actionwire.light import AbsLightController
 from actionwire.data_types import Match
-from actionwire.synchan import SynchanController, SynchanState
+from actionwire.rule import Devices, Rule, create_rule_stream
+from actionwire.synchan import (
+    Playhead,
+    SynchanController,
+    SynchanState,
+    create_cue_stream,
+    create_playhead,
+)
 from actionwire.utils import (
     format_timecode,
-    in_timecodes,
-    tc,
-    swap,
     on_off,
     before,
     after,
@@ -37,20 +38,24 @@ def create_events(
     w_light: AbsLightController,
     synchan: SynchanController,
     conf: config.Config,
+    scheduler: SchedulerBase | None = None,
 ) -> Observable[Action]:
+    """Wire keywords and the Synchan playhead to the actions of the show.
+
+    Every timer runs on `scheduler` when given, so the show can be replayed
+    in virtual time (see `actionwire.simulate`).
+    """
     print("create logic")
 
-    current_times = synchan_stream.pipe(
-        ops.map(lambda state: state.currentTime),
-        ops.share(),
+    playhead = (
+        Playhead(clock=lambda: scheduler.now.timestamp()) if scheduler else Playhead()
     )
+    current_times = create_playhead(synchan_stream, playhead, scheduler=scheduler)
 
-    def from_timecodes(k: str) -> Observable[float]:
-        return (
-            current_times.pipe(ops.filter(in_timecodes(conf.get_timecodes(k))))
-            if conf.enable_timecode
-            else rx.of()
-        )
+    # Timecode cues fire at their exact instant, shared by every keyword
+    due_cues = create_cue_stream(
+        synchan_stream, playhead, conf.cues, scheduler=scheduler
+    )
 
     # 關燈：在開始時關燈，以及 20:26 時關燈
     replay_stream = current_times.pipe(
@@ -78,86 +83,14 @@ def create_events(
         ops.map(lambda _: TurnOnAction(w_light, config.WHITE)),
     )
 
-    # 自己
-    self_stream = rx.merge(
-        keywords.pipe(ops.filter(lambda match: match.word == "自己")),
-        from_timecodes("自己"),
-    ).pipe(
-        ops.throttle_first(3),
-        ops.map(lambda match: FlashAction(p_light, 0.4)),
-    )
-
-    # 醒來
-    wake_stream = rx.merge(
-        keywords.pipe(ops.filter(lambda match: match.word == "醒来")),
-        from_timecodes("醒來"),
-    ).pipe(
-        ops.scan(swap, [p_light, w_light]),
-        ops.flat_map(
-            lambda pair: [
-                ColorAction(pair[0], config.YELLOW, -config.brightness_step),
-                ColorAction(pair[1], config.WHITE, config.brightness_step),
-            ]
-        ),
-    )
-
-    # 轉換
-    change_stream = rx.merge(
-        keywords.pipe(ops.filter(lambda match: match.word == "转换")),
-        from_timecodes("轉換"),
-    ).pipe(
-        ops.scan(swap, [p_light, w_light]),
-        ops.flat_map(
-            lambda pair: [
-                ColorAction(pair[0], config.YELLOW, -config.brightness_step),
-                ColorAction(pair[1], config.ORANGE, config.brightness_step),
-            ]
-        ),
-    )
-
-    # 就像你
-    like_you_stream = rx.merge(
-        keywords.pipe(ops.filter(lambda match: match.word == "就像你")),
-        from_timecodes("就像你"),
-    ).pipe(
-        ops.flat_map(
-            lambda _: rx.of(
-                SwapColorAction(p_light, [config.WHITE, config.YELLOW]),
-                SwapColorAction(w_light, [config.YELLOW, config.WHITE]),
-            )
-        ),
-    )
-
-    # 喝茶
-    tea_stream: Observable[Action] = keywords.pipe(
-        ops.filter(lambda match: match.word == "喝茶"),
-        ops.with_latest_from(current_times),
-        # 避免影片「喝這杯水」誤觸
-        ops.filter(
-            lambda t: t[1] > tc("00:30")
-            # 避免「特別差」誤觸
-            # and not (t[1] >= tc("06:30") and t[1] <= tc("07:10"))
-        ),
-        ops.throttle_first(15),
-        ops.flat_map(
-            lambda t: rx.merge(
-                rx.of(
-                    SeekAction(synchan, "00:24"),
-                    BrightnessAction(p_light, -config.brightness_step),
-                    BrightnessAction(w_light, config.brightness_step),
-                ),
-                # 8 秒後跳回原位置
-                rx.timer(8).pipe(
-                    ops.flat_map(
-                        lambda _: rx.of(
-                            SeekAction(synchan, t[1]),
-                            BrightnessAction(p_light, config.brightness_step),
-                            BrightnessAction(w_light, -config.brightness_step),
-                        )
-                    )
-                ),
-            )
-        ),
+    # 關鍵字規則：自己、醒來、轉換、就像你、喝茶
+    devices = Devices({"p": p_light, "w": w_light}, synchan, scheduler)
+    rule_stream = create_rule_stream(
+        [Rule.from_dict(rule, devices.lights) for rule in conf.rules],
+        keywords,
+        due_cues if conf.enable_timecode else rx.of(),
+        current_times,
+        devices,
     )
 
     # 喝這杯水
@@ -188,10 +121,10 @@ def create_events(
 
     # Timecode testing
     #
-    timecode = current_times.pipe(
+    timecode = synchan_stream.pipe(
         ops.map(
-            lambda currentTime: PrintAction(
-                f"Current Time: {format_timecode(currentTime)}"
+            lambda state: TimecodePrintAction(
+                f"Current Time: {format_timecode(state.currentTime)}"
             )
         ),
     )
@@ -200,11 +133,7 @@ def create_events(
         replay_stream if conf.enable_timecode else rx.of(),
         p_on_stream if conf.enable_timecode else rx.of(),
         w_on_stream if conf.enable_timecode else rx.of(),
-        self_stream,
-        change_stream,
-        tea_stream,
-        wake_stream,
-        like_you_stream,
+        rule_stream,
         drink_stream if conf.enable_timecode else rx.of(),
         timecode,
     )
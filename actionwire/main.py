@@ -1,21 +1,43 @@
 import argparse
+import os
 import sys
 from typing import Callable
 import wave
 import reactivex as rx
+import reactivex.operators as ops
 from reactivex.observable import Observable
 
-from actionwire import config, convert_audio, matching, mic, voice_detection
+from actionwire import (
+    config,
+    convert_audio,
+    log,
+    matching,
+    metrics,
+    mic,
+    recognizer_process,
+    resample,
+    store,
+    voice_detection,
+)
 from actionwire.action import Action
-from actionwire.data_types import Match
+from actionwire.data_types import Detection, Match
+from actionwire.executor import ActionExecutor
 from actionwire.light import GroupLightController, LifxLightController
 from actionwire.logic import create_events
 from actionwire.synchan import SynchanController, create_synchan
 
 
+executor = ActionExecutor()
+# Set by --store: the detections and executed actions are recorded there,
+# the detections under the name of their audio source
+show: store.ShowStore | None = None
+source = "mic"
+
+
 def subscribe(action: Action):
-    print(action)
-    action.do()
+    log.log(action.category, action)
+    metrics.actions.inc(action=type(action).__name__)
+    executor.submit(action)
 
 
 def callback(keyword_stream: Observable[Match]):
@@ -33,7 +55,9 @@ def callback(keyword_stream: Observable[Match]):
         brightness=config.initial_brightness,
     )
     synchan = SynchanController(c.synchan_url)
-    keyword_stream.subscribe(print)
+    keyword_stream.subscribe(lambda match: log.log("keyword", match))
+    if show is not None:
+        keyword_stream.subscribe(lambda match: show.record_detection(match, source))
     print("Create events")
     create_events(
         keyword_stream,
@@ -45,7 +69,56 @@ def callback(keyword_stream: Observable[Match]):
     ).subscribe(on_next=subscribe, on_error=print)
 
 
-def from_audio_file(file: str, cb: Callable[[Observable[Match]], None]):
+def audio_options(low_latency: bool, blocksize: int | None) -> int:
+    """Block size to use for the recognizer mode."""
+    if blocksize is not None:
+        return blocksize
+    return config.low_latency_blocksize if low_latency else config.blocksize
+
+
+def detect(
+    audio_stream: Observable[bytes],
+    framerate: int,
+    low_latency: bool,
+    vad: bool,
+    separate_process: bool = False,
+) -> Observable[Detection]:
+    audio_stream = audio_stream.pipe(resample.create_resampler(framerate))
+    framerate = config.model_samplerate
+    if separate_process:
+        return audio_stream.pipe(
+            recognizer_process.create_remote_recognizer(framerate, low_latency, vad)
+        )
+    gate = [voice_detection.create_vad(framerate)] if vad else []
+    vosk_stream = audio_stream.pipe(
+        *gate, voice_detection.create_vosk(framerate, low_latency)
+    )
+    return voice_detection.create_detection_stream(vosk_stream)
+
+
+def recognize(
+    audio_stream: Observable[bytes],
+    framerate: int,
+    low_latency: bool,
+    vad: bool,
+    separate_process: bool = False,
+) -> Observable[Match]:
+    detection_stream = detect(
+        audio_stream, framerate, low_latency, vad, separate_process
+    )
+    scanner = matching.KeywordScanner(config.keywords)
+    return scanner.scan(detection_stream)
+
+
+def from_audio_file(
+    file: str,
+    cb: Callable[[Observable[Match]], None],
+    low_latency: bool = False,
+    blocksize: int | None = None,
+    vad: bool = False,
+    realtime: bool = False,
+    separate_process: bool = False,
+):
     with wave.open(file, "rb") as wf:
         if (
             wf.getnchannels() != 1
@@ -56,19 +129,40 @@ def from_audio_file(file: str, cb: Callable[[Observable[Match]], None]):
             sys.exit(1)
 
         framerate = wf.getframerate()
-        # detection_stream = rx.from_list(matching.load_detections('./data/detections.csv'))
-        audio_stream = convert_audio.create_from_audio(wf)
-        vosk_stream = audio_stream.pipe(voice_detection.create_vosk(framerate))
-        detection_stream = voice_detection.create_detection_stream(vosk_stream)
-        scanner = matching.KeywordScanner(config.keywords)
-        cb(scanner.scan(detection_stream))
-
 
-def from_mic(cb: Callable[[Observable[Match]], None]):
     # detection_stream = rx.from_list(matching.load_detections('./data/detections.csv'))
-    audio_stream = mic.mic_stream
-    vosk_stream = audio_stream.pipe(voice_detection.create_vosk(config.samplerate))
-    detection_stream = voice_detection.create_detection_stream(vosk_stream)
+    audio_stream = convert_audio.create_from_file(
+        file, audio_options(low_latency, blocksize), realtime
+    )
+    cb(recognize(audio_stream, framerate, low_latency, vad, separate_process))
+
+
+def from_mic(
+    cb: Callable[[Observable[Match]], None],
+    low_latency: bool = False,
+    blocksize: int | None = None,
+    vad: bool = False,
+    separate_process: bool = False,
+    mics: list[str] | None = None,
+):
+    """Listen to the mics, each decoded by its own recognizer on its own
+    thread; the recognizers share one model."""
+    sources = [mic.MicSource.parse(spec) for spec in mics or config.mics]
+    array = mic.MicArray(
+        sources or [mic.MicSource()], audio_options(low_latency, blocksize)
+    )
+    detection_stream = voice_detection.merge_detections(
+        [
+            detect(
+                audio_stream.pipe(ops.subscribe_on(config.source_scheduler)),
+                framerate,
+                low_latency,
+                vad,
+                separate_process,
+            )
+            for audio_stream, framerate in array.streams()
+        ]
+    )
     scanner = matching.KeywordScanner(config.keywords)
     cb(scanner.scan(detection_stream))
 
@@ -91,14 +185,78 @@ if __name__ == "__main__":
         help="Mode to run: file (from audio file), mic (from microphone), or csv (from detections file)",
     )
 
+    parser.add_argument(
+        "--low-latency",
+        action="store_true",
+        help="Fire keywords from stable partial results, with smaller audio blocks",
+    )
+    parser.add_argument(
+        "--blocksize", type=int, help="Audio frames per block fed to the recognizer"
+    )
+    parser.add_argument(
+        "--vad",
+        action="store_true",
+        help="Skip decoding of audio blocks without speech",
+    )
+    parser.add_argument(
+        "--mic",
+        action="append",
+        metavar="DEVICE[:CHANNEL]",
+        help="Input device (name or index) and channel to listen to; "
+        "repeat for several mics",
+    )
+    parser.add_argument(
+        "--recognizer-process",
+        action="store_true",
+        help="Decode audio in a separate process, restarted if it crashes",
+    )
+
+    parser.add_argument(
+        "--store",
+        metavar="SHOW",
+        help="Record detections and executed actions as SHOW in the show store",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        help="Serve Prometheus metrics on http://127.0.0.1:PORT/metrics",
+    )
+    parser.add_argument(
+        "--metrics-file", help="Write a metrics snapshot to this file every 5 seconds"
+    )
+
     args = parser.parse_args()
 
+    if args.store:
+        show = store.ShowStore(os.path.join(store.STORE_PATH, args.store))
+        executor.record = show.record_action
+    source = os.path.basename(args.f) if args.mode == "file" and args.f else args.mode
+
+    if args.metrics_port:
+        metrics.registry.serve(args.metrics_port)
+    if args.metrics_file:
+        metrics.registry.write_snapshots(args.metrics_file)
+
     if args.mode == "file":
         if not args.f:
             print("Error: Audio file path required for file mode")
             sys.exit(1)
-        from_audio_file(args.f, callback)
+        from_audio_file(
+            args.f,
+            callback,
+            args.low_latency,
+            args.blocksize,
+            args.vad,
+            separate_process=args.recognizer_process,
+        )
     elif args.mode == "mic":
-        from_mic(callback)
+        from_mic(
+            callback,
+            args.low_latency,
+            args.blocksize,
+            args.vad,
+            args.recognizer_process,
+            args.mic,
+        )
     elif args.mode == "csv":
         from_csv(callback)
@@ -1,48 +1,112 @@
+from collections import deque
 import csv
+import os
 import sys
 import reactivex as rx
 import reactivex.operators as ops
 
 from actionwire.action import Action
 from actionwire.data_types import Detection, Match
-from actionwire import config, utils
-from actionwire.rule import KeyRule
+from actionwire import config, metrics, store, utils
 
-class Matcher:
-    def __init__(self, keywords: list[str], queue: str, match: Match | None):
-        self.queue = queue
-        self.new_match = match
+class KeywordAutomaton:
+    """Aho-Corasick automaton over the characters of the keywords.
+
+    Built once per keyword list; stepping it costs the same no matter how many
+    keywords are configured.
+    """
+
+    def __init__(self, keywords: list[str]):
         self.keywords = keywords
+        self.goto: list[dict[str, int]] = [{}]
+        self.fail: list[int] = [0]
+        # Keyword indexes ending at each node, in config order (= priority)
+        self.out: list[list[int]] = [[]]
+        self.max_length = max((len(k) for k in keywords), default=0)
+
+        for index, keyword in enumerate(keywords):
+            node = 0
+            for char in keyword:
+                if char not in self.goto[node]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                    self.goto[node][char] = len(self.goto) - 1
+                node = self.goto[node][char]
+            self.out[node].append(index)
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.out[child] = sorted(self.out[child] + self.out[self.fail[child]])
+
+    def step(self, node: int, char: str) -> int:
+        while node and char not in self.goto[node]:
+            node = self.fail[node]
+        return self.goto[node].get(char, 0)
 
-    def match(self, detection: Detection) -> 'Matcher':
-        queue = self.queue + detection.word
-        # print(utils.format_timecode(detection.start), concatStr)
-        for keyword in self.keywords:
-            if queue.find(keyword) != -1:
-                return Matcher(self.keywords, '', Match(start=detection.start, word=keyword, confidence=detection.confidence))
-        return Matcher(self.keywords, queue, None)
 
-    def hasMatch(self) -> bool:
-        return self.new_match is not None
+class Matcher:
+    """Streaming keyword matcher with bounded state.
+
+    Only the automaton node and the arrival time of the last `max_length`
+    characters are kept, so a long stretch without keywords costs no memory.
+    A keyword only matches if all its characters arrived within `window`
+    seconds.
+    """
+
+    def __init__(self, automaton: KeywordAutomaton, window: float):
+        self.automaton = automaton
+        self.window = window
+        self.node = 0
+        self.times: deque[float] = deque(maxlen=automaton.max_length)
+
+    def match(self, detection: Detection) -> Match | None:
+        for char in detection.word:
+            self.node = self.automaton.step(self.node, char)
+            self.times.append(detection.start)
+            for index in self.automaton.out[self.node]:
+                keyword = self.automaton.keywords[index]
+                if detection.start - self.times[-len(keyword)] <= self.window:
+                    self.reset()
+                    return Match(
+                        start=detection.start,
+                        word=keyword,
+                        confidence=detection.confidence,
+                        latency=detection.latency,
+                        end=detection.end,
+                    )
+        return None
 
-    def getMatch(self) -> Match:
-        if self.new_match is not None:
-            return self.new_match
-        raise Exception("No new match")
+    def reset(self):
+        self.node = 0
+        self.times.clear()
 
     def __str__(self):
-        return f"Matcher(matches={self.new_match}, queue={self.queue})"
+        return f"Matcher(node={self.node}, window={self.window})"
 
 
 class KeywordScanner:
-    def __init__(self, keywords: list[str]):
-        self.keywords = keywords
+    def __init__(self, keywords: list[str], window: float = config.match_window):
+        self.automaton = KeywordAutomaton(keywords)
+        self.window = window
 
     def scan(self, source: rx.Observable[Detection]) -> rx.Observable[Match]:
-        return source.pipe(
-            ops.scan(Matcher.match, Matcher(self.keywords, '', None)),
-            ops.filter(Matcher.hasMatch),
-            ops.map(Matcher.getMatch),
+        def matches(_) -> rx.Observable[Match]:
+            matcher = Matcher(self.automaton, self.window)
+            return source.pipe(
+                ops.map(matcher.match),
+                ops.filter(lambda match: match is not None),
+                ops.do_action(lambda match: metrics.matches.inc(keyword=match.word)),
+            )
+
+        return rx.defer(matches).pipe(
             ops.share(),
             ops.subscribe_on(config.thread_pool_scheduler)
         )
@@ -50,7 +114,9 @@ class KeywordScanner:
 
 
 def load_detections(file_path) -> list[Detection]:
-    """Load detections.csv file."""
+    """Load detections.csv file, or the detections of a stored show."""
+    if os.path.isdir(file_path):
+        return store.load_detections(file_path)
     detections: list[Detection] = []
     try:
         with open(file_path, 'r', encoding='utf-8') as f:
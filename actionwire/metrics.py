@@ -0,0 +1,222 @@
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import os
+from threading import Lock, Thread
+import time
+
+# Seconds, from a single packet to a slow seek
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values: dict[tuple[str, ...], float] = {}
+        self.lock = Lock()
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # Per label set: count per bucket (last one is +Inf), sum
+        self.values: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+        self.lock = Lock()
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(str(labels[name]) for name in self.labels)
+        i = bisect_left(self.buckets, value)
+        with self.lock:
+            counts, total = self.values.setdefault(
+                key, ([0] * (len(self.buckets) + 1), [0.0])
+            )
+            counts[i] += 1
+            total[0] += value
+
+    def time(self, **labels: str) -> "_Timer":
+        """Context manager observing the seconds spent in its block."""
+        return _Timer(self, labels)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, (counts, total) in sorted(self.values.items()):
+                cumulative = 0
+                for bound, count in zip([*self.buckets, "+Inf"], counts):
+                    cumulative += count
+                    le = _labels(self.labels, key, f'le="{bound}"')
+                    lines.append(f"{self.name}_bucket{le} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.labels, key)} {total[0]}")
+                lines.append(
+                    f"{self.name}_count{_labels(self.labels, key)} {cumulative}"
+                )
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: dict[str, str]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: list[Counter | Histogram] = []
+
+    def counter(self, name: str, help: str, labels: tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name, help, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(
+        self, name: str, help: str, labels: tuple[str, ...] = ()
+    ) -> Histogram:
+        metric = Histogram(name, help, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        return "\n".join(line for m in self.metrics for line in m.render()) + "\n"
+
+    def serve(self, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """Serve the metrics on http://host:port/metrics from a daemon thread."""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+        return server
+
+    def write_snapshots(self, path: str, interval: float = 5.0) -> Thread:
+        """Rewrite `path` with the current metrics every `interval` seconds."""
+
+        def run():
+            while True:
+                time.sleep(interval)
+                with open(path + ".tmp", "w") as f:
+                    f.write(self.render())
+                os.replace(path + ".tmp", path)
+
+        thread = Thread(target=run, name="metrics-snapshot", daemon=True)
+        thread.start()
+        return thread
+
+
+registry = Registry()
+
+audio_blocks = registry.counter(
+    "actionwire_audio_blocks_total", "Audio blocks fed to the recognizer"
+)
+dropped_blocks = registry.counter(
+    "actionwire_dropped_blocks_total",
+    "Audio blocks dropped because recognition fell behind and a ring was full",
+    ("ring",),
+)
+audio_underflows = registry.counter(
+    "actionwire_audio_underflows_total",
+    "Waits for an audio block that timed out after the stream started",
+    ("ring",),
+)
+recognizer_seconds = registry.histogram(
+    "actionwire_recognizer_block_seconds", "Time to decode one audio block"
+)
+recognizer_results = registry.counter(
+    "actionwire_recognizer_results_total",
+    "Results emitted by the recognizer",
+    ("kind",),
+)
+dropped_words = registry.counter(
+    "actionwire_dropped_words_total",
+    "Recognized words not turned into detections",
+    ("reason",),
+)
+detections = registry.counter("actionwire_detections_total", "Detections")
+word_latency = registry.histogram(
+    "actionwire_word_latency_seconds",
+    "Audio fed after the end of a word until its detection",
+)
+matches = registry.counter("actionwire_matches_total", "Keyword matches", ("keyword",))
+throttled_matches = registry.counter(
+    "actionwire_throttled_matches_total",
+    "Matches dropped by a rule throttle",
+    ("rule",),
+)
+actions = registry.counter("actionwire_actions_total", "Actions emitted", ("action",))
+action_wait_seconds = registry.histogram(
+    "actionwire_action_wait_seconds",
+    "Time an action waited in its device queue",
+    ("action",),
+)
+action_seconds = registry.histogram(
+    "actionwire_action_seconds", "Time until Action.do finished", ("action",)
+)
+action_failures = registry.counter(
+    "actionwire_action_failures_total", "Actions that raised", ("action",)
+)
+light_sync_seconds = registry.histogram(
+    "actionwire_light_sync_seconds", "Time to sync one bulb"
+)
+light_sync_failures = registry.counter(
+    "actionwire_light_sync_failures_total",
+    "Bulb syncs that failed or timed out",
+    ("reason",),
+)
+log_dropped = registry.counter(
+    "actionwire_log_dropped_total",
+    "Log lines dropped by a rate limit or a full buffer",
+    ("category", "reason"),
+)
+effect_frames = registry.counter(
+    "actionwire_effect_frames_total", "Frames rendered by the effect engine"
+)
+effect_late_frames = registry.counter(
+    "actionwire_effect_late_frames_total",
+    "Effect frames rendered a frame interval or more after they were due",
+)
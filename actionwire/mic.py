@@ -1,40 +1,268 @@
+from dataclasses import dataclass
 from numbers import Number
 import sys
-import time
+from threading import Event, Lock
+import numpy as np
 import reactivex as rx
 import reactivex.operators as ops
-import sounddevice as sd  # type: ignore
 from reactivex.abc import DisposableBase, ObserverBase, SchedulerBase, disposable
 
-from actionwire import config
+from actionwire import config, metrics
 
 
-def create_mic(observer: ObserverBase[bytes], scheduler):
-    print("Create microphone")
+class BlockRingBuffer:
+    """Preallocated single-producer, single-consumer ring of audio blocks.
 
-    def callback(indata, frames, time, status):
+    The producer (the PortAudio callback) only copies into the next free
+    slot and bumps `written`; the consumer reads slots in place as
+    memoryviews and bumps `read` once it is done with them. Each counter is
+    only written by one side, so no lock is needed. A block that arrives
+    while the ring is full is dropped and counted in `overflows`; a wait of
+    the consumer that times out once the stream has started is counted in
+    `underflows`: the device stopped delivering.
+    """
+
+    def __init__(self, block_bytes: int, blocks: int):
+        self.block_bytes = block_bytes
+        self.blocks = blocks
+        self.buffer = bytearray(block_bytes * blocks)
+        self.view = memoryview(self.buffer)
+        self.lengths = [0] * blocks
+        self.written = 0
+        self.read = 0
+        self.overflows = 0
+        self.underflows = 0
+        self.closed = False
+        self.ready = Event()
+
+    def write(self, data) -> bool:
+        if self.written - self.read >= self.blocks:
+            self.overflows += 1
+            return False
+        slot = self.written % self.blocks
+        start = slot * self.block_bytes
+        data = memoryview(data).cast("B")
+        length = min(len(data), self.block_bytes)
+        self.view[start : start + length] = data[:length]
+        self.lengths[slot] = length
+        self.written += 1
+        self.ready.set()
+        return True
+
+    def peek(self, timeout: float | None = None) -> memoryview | None:
+        """The oldest unread block, valid until `release` is called. None
+        when no block came within `timeout` or the ring is closed."""
+        if self.read == self.written:
+            self.ready.clear()
+            # The producer may have written between the check and the clear
+            if self.read == self.written and not self.closed:
+                if not self.ready.wait(timeout) and self.written:
+                    self.underflows += 1
+            if self.read == self.written:
+                return None
+        slot = self.read % self.blocks
+        start = slot * self.block_bytes
+        return self.view[start : start + self.lengths[slot]]
+
+    def release(self):
+        self.read += 1
+
+    def close(self):
+        """Wake the consumer: no more blocks will come."""
+        self.closed = True
+        self.ready.set()
+
+    def __len__(self) -> int:
+        return self.written - self.read
+
+
+@dataclass(frozen=True)
+class MicSource:
+    """An input device (sounddevice name or index, None for the default)
+    and one of its channels, counted from 1."""
+
+    device: int | str | None = None
+    channel: int = 1
+
+    @classmethod
+    def parse(cls, spec: str) -> "MicSource":
+        """Parse "device", "device:channel" or ":channel" (default device).
+        A device name containing a colon needs the channel too."""
+        device, colon, channel = spec.rpartition(":")
+        if not colon or not channel.isdigit():
+            device, channel = spec, "1"
+        return cls(int(device) if device.isdigit() else device or None, int(channel))
+
+    def __str__(self):
+        name = "default" if self.device is None else str(self.device)
+        return f"{name}:{self.channel}"
+
+
+class InputDevice:
+    """One input stream of a device, split into a ring buffer per channel."""
+
+    def __init__(self, device: int | str | None, channels: set[int], blocksize: int):
+        self.device = device
+        self.channels = channels
+        self.blocksize = blocksize
+        self.rings: dict[int, BlockRingBuffer] = {}
+        self.statuses: dict[int, list] = {}
+        self.finished = Event()
+        self.stream = None
+
+    @property
+    def samplerate(self) -> int:
+        if self.device is None:
+            return config.samplerate
+        import sounddevice as sd  # type: ignore
+
+        return int(sd.query_devices(self.device, kind="input")["default_samplerate"])
+
+    def callback(self, indata, frames, time, status):
         """This is called (from a separate thread) for each audio block."""
         if status:
-            print(status, file=sys.stderr)
-        observer.on_next(bytes(indata))
-
-    def finish_callback():
-        observer.on_completed()
-
-    # Start the stream asynchronously
-    with sd.RawInputStream(
-        samplerate=config.samplerate,
-        blocksize=8000,
-        dtype="int16",
-        channels=1,
-        callback=callback,
-        finished_callback=finish_callback,
-    ):
-        while True:
-            time.sleep(1)
-
-
-mic_stream = rx.create(create_mic)
+            for statuses in self.statuses.values():
+                statuses.append(status)
+        count = max(self.channels)
+        if count == 1:
+            self.rings[1].write(indata)
+            return
+        samples = np.frombuffer(indata, dtype=np.int16).reshape(-1, count)
+        for channel, ring in self.rings.items():
+            ring.write(np.ascontiguousarray(samples[:, channel - 1]))
+
+    def start(self):
+        import sounddevice as sd  # type: ignore
+
+        self.rings = {
+            channel: BlockRingBuffer(self.blocksize * 2, config.ring_blocks)  # int16
+            for channel in self.channels
+        }
+        self.statuses = {channel: [] for channel in self.channels}
+        self.finished.clear()
+        self.stream = sd.RawInputStream(
+            samplerate=self.samplerate,
+            blocksize=self.blocksize,
+            device=self.device,
+            dtype="int16",
+            channels=max(self.channels),
+            callback=self.callback,
+            finished_callback=self.finish,
+        )
+        self.stream.start()
+
+    def finish(self):
+        self.finished.set()
+        for ring in self.rings.values():
+            ring.close()
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+
+class MicArray:
+    """Mics on one or more input devices, started and stopped together.
+
+    Each device is opened once, with as many channels as the highest one
+    used. All streams start when the first mic is subscribed, so the blocks
+    of every mic, and the word times of their recognizers, share an origin;
+    a mic subscribed a little later finds its first blocks in its ring.
+    """
+
+    def __init__(self, sources: list[MicSource], blocksize: int = config.blocksize):
+        self.sources = sources
+        channels: dict[int | str | None, set[int]] = {}
+        for source in sources:
+            channels.setdefault(source.device, set()).add(source.channel)
+        self.devices = {
+            device: InputDevice(device, used, blocksize)
+            for device, used in channels.items()
+        }
+        self.lock = Lock()
+        self.users = 0
+
+    def open(self):
+        with self.lock:
+            self.users += 1
+            if self.users == 1:
+                for device in self.devices.values():
+                    device.start()
+
+    def close(self):
+        with self.lock:
+            self.users -= 1
+            if self.users == 0:
+                for device in self.devices.values():
+                    device.close()
+
+    def stream(self, source: MicSource) -> rx.Observable[bytes]:
+        """Blocks of one mic. Subscribing blocks the thread."""
+        return rx.create(
+            lambda observer, scheduler: create_mic(observer, scheduler, self, source)
+        )
+
+    def streams(self) -> list[tuple[rx.Observable[bytes], int]]:
+        """The stream and the sample rate of every mic."""
+        return [
+            (self.stream(source), self.devices[source.device].samplerate)
+            for source in self.sources
+        ]
+
+
+def create_mic(
+    observer: ObserverBase[bytes],
+    scheduler,
+    mics: MicArray,
+    source: MicSource = MicSource(),
+):
+    """Capture a mic into a ring buffer and feed its blocks to the observer
+    from this (consumer) thread.
+
+    The emitted memoryviews point into the ring: observers must use them
+    before returning, or copy them.
+    """
+    print(f"Create microphone {source}")
+    device = mics.devices[source.device]
+    mics.open()
+    try:
+        ring = device.rings[source.channel]
+        statuses = device.statuses[source.channel]
+        overflows = underflows = 0
+        while not (device.finished.is_set() and len(ring) == 0):
+            while statuses:
+                print(statuses.pop(0), file=sys.stderr)
+            if ring.overflows != overflows:
+                metrics.dropped_blocks.inc(
+                    ring.overflows - overflows, ring=f"mic {source}"
+                )
+                overflows = ring.overflows
+                print(
+                    f"Recognition behind real time: {overflows} blocks dropped",
+                    file=sys.stderr,
+                )
+            block = ring.peek(timeout=1)
+            if ring.underflows != underflows:
+                metrics.audio_underflows.inc(
+                    ring.underflows - underflows, ring=f"mic {source}"
+                )
+                underflows = ring.underflows
+                print(f"No audio from {source} for a second", file=sys.stderr)
+            if block is None:
+                continue
+            observer.on_next(block)
+            ring.release()
+    finally:
+        mics.close()
+    observer.on_completed()
+
+
+def create_mic_stream(blocksize: int = config.blocksize) -> rx.Observable[bytes]:
+    return MicArray([MicSource()], blocksize).stream(MicSource())
+
+
+mic_stream = create_mic_stream()
 
 if __name__ == "__main__":
     mic_stream.subscribe(lambda x: print("got data", len(x)))
@@ -0,0 +1,302 @@
+import multiprocessing
+from multiprocessing.connection import Connection
+from multiprocessing.shared_memory import SharedMemory
+import sys
+from threading import Lock, Thread
+import time
+
+import numpy as np
+import reactivex as rx
+from reactivex.abc import ObserverBase
+from reactivex.disposable import Disposable
+from reactivex.observable.observable import Observable
+from reactivex.subject import Subject
+
+from actionwire import config, metrics
+from actionwire.data_types import Detection
+
+# Header of the shared ring: blocks written, blocks read, frames decoded,
+# and whether the producer is done
+WRITTEN, READ, CONSUMED, CLOSED = range(4)
+HEADER = 4
+
+
+class SharedBlockRing:
+    """`mic.BlockRingBuffer` in shared memory, between two processes.
+
+    The counters live in the shared header, so a restarted consumer resumes
+    at the first block its predecessor did not finish, and knows how many
+    frames were decoded before it (to keep word times continuous).
+    """
+
+    def __init__(self, shm: SharedMemory, blocks: int, block_bytes: int, ready):
+        self.shm = shm
+        self.blocks = blocks
+        self.block_bytes = block_bytes
+        self.ready = ready
+        self.header = np.ndarray((HEADER,), dtype=np.uint64, buffer=shm.buf)
+        self.lengths = np.ndarray(
+            (blocks,), dtype=np.uint32, buffer=shm.buf, offset=HEADER * 8
+        )
+        self.data = shm.buf[HEADER * 8 + blocks * 4 :]
+        self.overflows = 0
+
+    @staticmethod
+    def size(blocks: int, block_bytes: int) -> int:
+        return HEADER * 8 + blocks * 4 + blocks * block_bytes
+
+    def __len__(self) -> int:
+        return int(self.header[WRITTEN] - self.header[READ])
+
+    def write(self, data) -> bool:
+        """Copy a block in, split over several slots if it is larger than one."""
+        view = memoryview(data).cast("B")
+        for start in range(0, len(view), self.block_bytes):
+            if len(self) >= self.blocks:
+                self.overflows += 1
+                return False
+            part = view[start : start + self.block_bytes]
+            slot = int(self.header[WRITTEN]) % self.blocks
+            offset = slot * self.block_bytes
+            self.data[offset : offset + len(part)] = part
+            self.lengths[slot] = len(part)
+            self.header[WRITTEN] += 1
+            self.ready.set()
+        return True
+
+    def close(self):
+        self.header[CLOSED] = 1
+        self.ready.set()
+
+    @property
+    def closed(self) -> bool:
+        return bool(self.header[CLOSED])
+
+    def peek(self, timeout: float) -> memoryview | None:
+        if len(self) == 0:
+            self.ready.clear()
+            if len(self) == 0 and not self.ready.wait(timeout):
+                return None
+            if len(self) == 0:
+                return None
+        slot = int(self.header[READ]) % self.blocks
+        offset = slot * self.block_bytes
+        return self.data[offset : offset + int(self.lengths[slot])]
+
+    def release(self, frames: int):
+        self.header[CONSUMED] += frames
+        self.header[READ] += 1
+
+    def release_views(self):
+        """Drop the views on the shared buffer so it can be closed."""
+        del self.header, self.lengths
+        self.data.release()
+
+
+def _work(
+    name: str,
+    blocks: int,
+    block_bytes: int,
+    ready,
+    conn: Connection,
+    framerate: int,
+    low_latency: bool,
+    vad: bool,
+):
+    """Recognizer process: decode the ring and send back compact detections
+    as (start, end, word, confidence, latency) tuples, then None at the end."""
+    from actionwire import voice_detection
+
+    shm = SharedMemory(name)
+    ring = SharedBlockRing(shm, blocks, block_bytes, ready)
+    offset = int(ring.header[CONSUMED]) / framerate
+
+    def send(detection: Detection):
+        conn.send(
+            (
+                detection.start + offset,
+                detection.end + offset,
+                detection.word,
+                detection.confidence,
+                detection.latency,
+            )
+        )
+
+    audio: Subject = Subject()
+    gate = [voice_detection.create_vad(framerate)] if vad else []
+    vosk_stream = audio.pipe(*gate, voice_detection.create_vosk(framerate, low_latency))
+    voice_detection.create_detection_stream(vosk_stream).subscribe(send)
+
+    while True:
+        block = ring.peek(timeout=0.5)
+        if block is None:
+            if ring.closed and len(ring) == 0:
+                break
+            continue
+        audio.on_next(block)
+        frames = len(block) // 2  # int16 mono
+        block.release()
+        ring.release(frames)
+    audio.on_completed()
+    conn.send(None)
+    ring.release_views()
+    shm.close()
+
+
+class RecognizerProcess:
+    """Vosk in a child process, fed through a shared-memory ring.
+
+    A reader thread turns the messages of the child into detections. If the
+    child dies before the end of the audio, a new one is started on the same
+    ring, up to `max_restarts` times.
+    """
+
+    def __init__(
+        self,
+        framerate: int,
+        low_latency: bool = False,
+        vad: bool = False,
+        blocks: int = config.ring_blocks,
+        block_bytes: int = config.blocksize * 2,
+        max_restarts: int = 5,
+    ):
+        self.context = multiprocessing.get_context("spawn")
+        self.args = (framerate, low_latency, vad)
+        self.blocks = blocks
+        self.block_bytes = block_bytes
+        self.max_restarts = max_restarts
+        self.restarts = 0
+        self.shm = SharedMemory(
+            create=True, size=SharedBlockRing.size(blocks, block_bytes)
+        )
+        self.ring = SharedBlockRing(
+            self.shm, blocks, block_bytes, self.context.Event()
+        )
+        self.ring.header[:] = 0
+        self.lock = Lock()
+        self.disposed = False
+        self.process: multiprocessing.process.BaseProcess | None = None
+        self.conn: Connection | None = None
+
+    def _spawn(self):
+        receiver, sender = self.context.Pipe(duplex=False)
+        self.process = self.context.Process(
+            target=_work,
+            args=(
+                self.shm.name,
+                self.blocks,
+                self.block_bytes,
+                self.ring.ready,
+                sender,
+                *self.args,
+            ),
+            name="recognizer",
+            daemon=True,
+        )
+        self.process.start()
+        sender.close()
+        self.conn = receiver
+
+    def write(self, block):
+        with self.lock:
+            if self.disposed:
+                return
+            if not self.ring.write(block):
+                metrics.dropped_blocks.inc(ring="recognizer")
+                print(
+                    f"Recognizer behind real time: {self.ring.overflows} blocks dropped",
+                    file=sys.stderr,
+                )
+
+    def finish(self):
+        with self.lock:
+            if not self.disposed:
+                self.ring.close()
+
+    def run(self, observer: ObserverBase[Detection]):
+        """Start the child and forward its detections until the audio ends."""
+        error: Exception | None = None
+        try:
+            self._spawn()
+            while True:
+                try:
+                    message = self.conn.recv()
+                except EOFError:
+                    self.process.join()
+                    if self.restarts >= self.max_restarts:
+                        raise RuntimeError(
+                            f"Recognizer process exited with {self.process.exitcode}"
+                        )
+                    self.restarts += 1
+                    print(
+                        f"Recognizer process exited with {self.process.exitcode}, "
+                        f"restarting ({self.restarts}/{self.max_restarts})",
+                        file=sys.stderr,
+                    )
+                    time.sleep(0.5)
+                    self._spawn()
+                    continue
+                if message is None:
+                    self.process.join()
+                    break
+                start, end, word, confidence, latency = message
+                observer.on_next(Detection(start, word, confidence, latency, end))
+        except Exception as e:
+            error = e
+        # Release the shared memory before the observer may end the program
+        self.dispose()
+        if error is not None:
+            observer.on_error(error)
+        else:
+            observer.on_completed()
+
+    def dispose(self):
+        with self.lock:
+            if self.disposed:
+                return
+            self.disposed = True
+            if self.process is not None and self.process.is_alive():
+                self.process.terminate()
+            self.ring.release_views()
+            self.shm.close()
+            self.shm.unlink()
+
+
+def create_remote_recognizer(
+    framerate: int,
+    low_latency: bool = False,
+    vad: bool = False,
+    **kwargs,
+):
+    """Audio blocks to detections, decoded in a `RecognizerProcess`.
+
+    Replaces `create_vad`, `create_vosk` and `create_detection_stream`; the
+    calling process only copies blocks into shared memory.
+    """
+
+    def _remote(source: Observable[bytes]) -> Observable[Detection]:
+        def subscribe(observer: ObserverBase[Detection], scheduler=None):
+            recognizer = RecognizerProcess(framerate, low_latency, vad, **kwargs)
+            reader = Thread(
+                target=recognizer.run,
+                args=(observer,),
+                name="recognizer-reader",
+                daemon=True,
+            )
+            reader.start()
+            subscription = source.subscribe(
+                recognizer.write,
+                observer.on_error,
+                recognizer.finish,
+                scheduler=scheduler,
+            )
+
+            def dispose():
+                subscription.dispose()
+                recognizer.finish()
+
+            return Disposable(dispose)
+
+        return rx.create(subscribe)
+
+    return _remote
@@ -0,0 +1,97 @@
+from math import gcd
+
+import numpy as np
+import reactivex as rx
+from reactivex.abc import ObserverBase
+from reactivex.observable.observable import Observable
+
+from actionwire import config
+
+
+class PolyphaseResampler:
+    """Streaming rational resampler for int16 mono audio.
+
+    Upsamples by `up`, low-pass filters and downsamples by `down`, computing
+    only the output samples: each one is the dot product of the last `taps`
+    input samples with one of the `up` phases of a Kaiser-windowed sinc.
+    The input tail is carried across blocks, so the output of a stream does
+    not depend on how it was split. Output lags the input by half the filter,
+    about 1 ms from 44.1 or 48 kHz.
+    """
+
+    def __init__(
+        self,
+        from_rate: int,
+        to_rate: int,
+        zero_crossings: int = 16,
+        rolloff: float = 0.95,
+        beta: float = 8.6,
+    ):
+        divisor = gcd(from_rate, to_rate)
+        self.up = to_rate // divisor
+        self.down = from_rate // divisor
+        factor = max(self.up, self.down)
+        length = 2 * zero_crossings * factor + 1
+        self.taps = -(-length // self.up)  # Per phase, rounded up
+
+        t = np.arange(self.taps * self.up) - (length - 1) / 2
+        cutoff = rolloff / factor
+        h = self.up * cutoff * np.sinc(cutoff * t)
+        h *= np.kaiser(len(t), beta)
+        h[length:] = 0
+        # phases[p, i] weights the sample i - taps + 1 before the current one
+        self.phases = h.reshape(self.taps, self.up).T[:, ::-1].copy()
+
+        self.history = np.zeros(self.taps - 1)
+        self.consumed = 0  # Input samples before `history` ends
+        self.produced = 0  # Output samples emitted
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        """Resampled int16 samples of the next input block."""
+        x = np.concatenate((self.history, samples))
+        total = self.consumed + len(samples)
+        end = -(-total * self.up // self.down)  # First output needing later input
+        n = np.arange(self.produced, end)
+        position = n * self.down
+        # Row of each output in the windows of x: its newest input sample
+        rows = position // self.up - self.consumed
+        windows = np.lib.stride_tricks.sliding_window_view(x, self.taps)
+        y = np.einsum("ij,ij->i", windows[rows], self.phases[position % self.up])
+
+        self.history = x[len(x) - self.taps + 1 :]
+        self.consumed = total
+        self.produced = end
+        return np.clip(np.rint(y), -32768, 32767).astype(np.int16)
+
+
+def create_resampler(from_rate: int, to_rate: int = config.model_samplerate):
+    """Convert int16 mono blocks from `from_rate` to `to_rate`, the rate of
+    the Vosk model. Passes blocks through when the rates are the same."""
+
+    def _resample(source: Observable[bytes]) -> Observable[bytes]:
+        if from_rate == to_rate:
+            return source
+
+        def subscribe(observer: ObserverBase[bytes], scheduler=None):
+            resampler = PolyphaseResampler(from_rate, to_rate)
+
+            def on_next(block):
+                samples = np.frombuffer(block, dtype=np.int16)
+                out = resampler.process(samples)
+                if len(out):
+                    observer.on_next(out.tobytes())
+
+            return source.subscribe(
+                on_next, observer.on_error, observer.on_completed, scheduler=scheduler
+            )
+
+        return rx.create(subscribe)
+
+    return _resample
+
+
+def resample(samples: np.ndarray, from_rate: int, to_rate: int) -> np.ndarray:
+    """Resample a whole int16 signal at once."""
+    if from_rate == to_rate:
+        return samples
+    return PolyphaseResampler(from_rate, to_rate).process(samples)
@@ -1,23 +1,374 @@
-from actionwire.action import Action, PrintAction
+import re
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Callable, Generic, Hashable, Iterable, TypeVar
 
+import reactivex as rx
+import reactivex.operators as ops
+from reactivex.abc import SchedulerBase
+from reactivex.observable.observable import Observable
+from reactivex.scheduler import ImmediateScheduler, TimeoutScheduler
+from reactivex.subject import Subject
 
-class KeyRule:
-    def __init__(self, keywords: list[str]):
-        self.keywords = keywords
+from actionwire import config, effect, metrics
+from actionwire.action import (
+    Action,
+    BrightnessAction,
+    ColorAction,
+    EffectAction,
+    FlashAction,
+    PrintAction,
+    SeekAction,
+    SwapColorAction,
+)
+from actionwire.color import Color
+from actionwire.data_types import Match
+from actionwire.light import AbsLightController
+from actionwire.synchan import SynchanController
+from actionwire.utils import tc
 
-    def satisfies(self, input: str) -> Action | None:
-        for keyword in self.keywords:
-            if input.find(keyword) != -1:
-                return PrintAction(keyword)
-        return None
+T = TypeVar("T")
 
 
-# rules = [
-#     KeyRule(
-#         keywords=["喝茶"],
-#         OnOffEvent(),
-#         actions=[
-#             SeekAction("00:24")
-#         ]
-#     )
-# ]
+def throttle_first(
+    duration: float, rule: str, scheduler: SchedulerBase | None = None
+):
+    """`ops.throttle_first` that counts the items it drops."""
+    window = timedelta(seconds=duration)
+
+    def _throttle(source: Observable) -> Observable:
+        def subscribe(observer, scheduler_=None):
+            _scheduler = scheduler or scheduler_ or TimeoutScheduler.singleton()
+            last: datetime | None = None
+
+            def on_next(value):
+                nonlocal last
+                now = _scheduler.now
+                if last is None or now - last >= window:
+                    last = now
+                    observer.on_next(value)
+                else:
+                    metrics.throttled_matches.inc(rule=rule)
+
+            return source.subscribe(
+                on_next, observer.on_error, observer.on_completed, scheduler=scheduler_
+            )
+
+        return rx.create(subscribe)
+
+    return _throttle
+
+
+class Demultiplexer(Generic[T]):
+    """Route every item of a source to the subjects of its keys.
+
+    Handlers subscribe to `route(key)`; `connect()` then subscribes the source
+    once. Each item costs a dict lookup per key it carries, no matter how
+    many routes exist.
+    """
+
+    def __init__(self, source: Observable[T], keys: Callable[[T], Iterable[Hashable]]):
+        self.source = source
+        self.keys = keys
+        self.routes: dict[Hashable, Subject[T]] = {}
+
+    def route(self, key: Hashable) -> Observable[T]:
+        if key not in self.routes:
+            self.routes[key] = Subject()
+        return self.routes[key]
+
+    def connect(self) -> Observable[Any]:
+        def dispatch(item: T):
+            for key in self.keys(item):
+                subject = self.routes.get(key)
+                if subject is not None:
+                    subject.on_next(item)
+
+        def error(err: Exception):
+            for subject in self.routes.values():
+                subject.on_error(err)
+
+        def complete():
+            for subject in self.routes.values():
+                subject.on_completed()
+
+        return self.source.pipe(
+            ops.do_action(dispatch, error, complete),
+            ops.ignore_elements(),
+        )
+
+
+@dataclass
+class Devices:
+    lights: dict[str, AbsLightController]
+    synchan: SynchanController
+    scheduler: SchedulerBase | None = None
+
+
+ACTIONS = {
+    "flash",
+    "color",
+    "swap_color",
+    "brightness",
+    "pulse",
+    "fade",
+    "crossfade",
+    "seek",
+    "print",
+}
+LIGHT_ACTIONS = ACTIONS - {"seek", "print"}
+
+
+@dataclass
+class ActionSpec:
+    """One action of a rule.
+
+    `do` is flash, color, swap_color, brightness, seek or print, or one of
+    the effects pulse (`count` swells of `length` seconds to full
+    brightness), fade (by `steps` over `length` seconds) and crossfade (to
+    `color` over `length` seconds). A seek `to` "back" returns to the
+    playhead position the rule fired at.
+    """
+
+    do: str
+    light: str | None = None
+    color: str | None = None
+    colors: list[str] = field(default_factory=list)
+    steps: int = 0
+    length: float = 0.5
+    to: str | None = None
+    text: str = ""
+    delay: float = 0
+    count: int = 1
+
+    def check(self, lights: Iterable[str]):
+        """Raise ValueError if the action could not be created when fired."""
+        if self.do not in ACTIONS:
+            raise ValueError(f"unknown action {self.do!r}")
+        if self.do in LIGHT_ACTIONS and self.light not in lights:
+            raise ValueError(f"{self.do} needs a light, one of {sorted(lights)}")
+        colors = [self.color] if self.do in ("color", "crossfade") else []
+        if self.do == "swap_color":
+            if not self.colors:
+                raise ValueError("swap_color needs colors")
+            colors = self.colors
+        for color in colors:
+            if not isinstance(getattr(config, str(color), None), Color):
+                raise ValueError(f"unknown color {color!r}")
+        if self.do == "seek" and self.to != "back":
+            if not re.fullmatch(r"\d+:\d{2}", str(self.to)):
+                raise ValueError(f"seek needs MM:SS or back, not {self.to!r}")
+
+    def create(self, devices: Devices, light: str | None, t: float | None) -> Action:
+        controller = devices.lights[light] if light else None
+        if self.do == "flash":
+            return FlashAction(controller, self.length, devices.scheduler)
+        if self.do == "color":
+            color = getattr(config, self.color)
+            return ColorAction(controller, color, self.steps * config.brightness_step)
+        if self.do == "swap_color":
+            colors = [getattr(config, color) for color in self.colors]
+            return SwapColorAction(controller, colors)
+        if self.do == "brightness":
+            return BrightnessAction(controller, self.steps * config.brightness_step)
+        if self.do == "pulse":
+            return EffectAction(
+                controller,
+                lambda _: effect.pulse(config.MAX_BRIGHTNESS, self.length, self.count),
+                devices.scheduler,
+            )
+        if self.do == "fade":
+            return EffectAction(
+                controller,
+                lambda color: effect.fade(
+                    color.adjust_brightness(
+                        self.steps * config.brightness_step
+                    ).brightness,
+                    self.length,
+                ),
+                devices.scheduler,
+            )
+        if self.do == "crossfade":
+            color = getattr(config, self.color)
+            return EffectAction(
+                controller,
+                lambda _: effect.crossfade(color, self.length),
+                devices.scheduler,
+            )
+        if self.do == "seek":
+            if self.to == "back":
+                if t is None:
+                    raise ValueError("seek back needs the playhead position")
+                return SeekAction(devices.synchan, t)
+            return SeekAction(devices.synchan, self.to)
+        if self.do == "print":
+            return PrintAction(self.text)
+        raise ValueError(f"Unknown action: {self.do}")
+
+
+@dataclass
+class Rule:
+    keyword: str | None = None
+    timecode: str | None = None
+    windows: list[tuple[float, float]] = field(default_factory=list)
+    throttle: float = 0
+    alternate: bool = False
+    actions: list[ActionSpec] = field(default_factory=list)
+
+    @classmethod
+    def from_dict(
+        cls, obj: dict[str, Any], lights: Iterable[str] = ("p", "w")
+    ) -> "Rule":
+        """Build a rule from the config, raising ValueError on a mistake that
+        would otherwise only show when the rule fires."""
+        name = obj.get("keyword") or obj.get("timecode")
+        if not name:
+            raise ValueError(f"Rule needs a keyword or a timecode: {obj}")
+        actions = []
+        for action in obj.get("actions", []):
+            try:
+                spec = ActionSpec(**action)
+                spec.check(lights)
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"Rule {name}: {e}") from e
+            actions.append(spec)
+
+        return cls(
+            keyword=obj.get("keyword"),
+            timecode=obj.get("timecode"),
+            windows=[
+                (
+                    tc(start) if start else float("-inf"),
+                    tc(end) if end else float("inf"),
+                )
+                for start, end in obj.get("windows", [])
+            ],
+            throttle=obj.get("throttle", 0),
+            alternate=obj.get("alternate", False),
+            actions=actions,
+        )
+
+    @property
+    def name(self) -> str:
+        return self.keyword or self.timecode or "rule"
+
+    def needs_playhead(self) -> bool:
+        return bool(self.windows) or any(
+            action.do == "seek" and action.to == "back" for action in self.actions
+        )
+
+    def in_windows(self, t: float) -> bool:
+        return any(start < t < end for start, end in self.windows)
+
+    def fire(
+        self,
+        devices: Devices,
+        count: int,
+        t: float | None,
+        trigger: Match | None = None,
+    ) -> Observable[Action]:
+        """Actions of the `count`-th firing at playhead position `t`. Those
+        without a delay carry the `trigger` match."""
+        swapped = self.alternate and count % 2 == 1
+        delays: dict[float, list[ActionSpec]] = {}
+        for action in self.actions:
+            delays.setdefault(action.delay, []).append(action)
+
+        def create(specs: list[ActionSpec]) -> list[Action]:
+            return [
+                spec.create(
+                    devices, _swap_light(spec.light) if swapped else spec.light, t
+                )
+                for spec in specs
+            ]
+
+        def create_now(specs: list[ActionSpec]) -> list[Action]:
+            actions = create(specs)
+            for action in actions:
+                action.trigger = trigger
+            return actions
+
+        # Emitted on the calling thread: a match arrives on the audio source
+        # thread, whose trampoline is busy until the source completes
+        groups = [
+            rx.from_iterable(create_now(specs), ImmediateScheduler())
+            if delay == 0
+            else rx.timer(delay, scheduler=devices.scheduler).pipe(
+                ops.flat_map(
+                    lambda _, specs=specs: rx.from_iterable(
+                        create(specs), ImmediateScheduler()
+                    )
+                )
+            )
+            for delay, specs in delays.items()
+        ]
+        if len(groups) == 1:
+            return groups[0]
+        return rx.from_iterable(groups, ImmediateScheduler()).pipe(ops.merge_all())
+
+    def create_stream(
+        self,
+        keywords: Demultiplexer[Match],
+        cues: Demultiplexer[tuple[float, list[str]]],
+        current_times: Observable[float],
+        devices: Devices,
+    ) -> Observable[Action]:
+        sources: list[Observable[Any]] = []
+        if self.keyword:
+            sources.append(keywords.route(self.keyword))
+        if self.timecode:
+            sources.append(cues.route(self.timecode))
+
+        # (match or cue, playhead position)
+        stream = rx.merge(*sources)
+        if self.needs_playhead():
+            stream = stream.pipe(ops.with_latest_from(current_times))
+            if self.windows:
+                stream = stream.pipe(ops.filter(lambda pair: self.in_windows(pair[1])))
+        else:
+            stream = stream.pipe(ops.map(lambda item: (item, None)))
+        if self.throttle:
+            stream = stream.pipe(
+                throttle_first(self.throttle, self.name, devices.scheduler)
+            )
+        return stream.pipe(
+            ops.map_indexed(lambda pair, count: (count, *pair)),
+            ops.flat_map(
+                lambda fired: self.fire(
+                    devices,
+                    fired[0],
+                    fired[2],
+                    fired[1] if isinstance(fired[1], Match) else None,
+                )
+            ),
+        )
+
+
+def _swap_light(light: str | None) -> str | None:
+    return {"p": "w", "w": "p"}.get(light, light) if light else light
+
+
+def create_rule_stream(
+    rules: list[Rule],
+    keywords: Observable[Match],
+    cues: Observable[tuple[float, list[str]]],
+    current_times: Observable[float],
+    devices: Devices,
+) -> Observable[Action]:
+    """Compile the rules into one dispatch table over keywords and cues.
+
+    Each match and cue is routed to the rules of its word by a dict lookup,
+    so the work per detection does not grow with the number of rules.
+    """
+
+    def build(_) -> Observable[Action]:
+        keyword_routes = Demultiplexer(keywords, lambda match: (match.word,))
+        cue_routes = Demultiplexer(cues, lambda cue: cue[1])
+        streams = [
+            rule.create_stream(keyword_routes, cue_routes, current_times, devices)
+            for rule in rules
+        ]
+        # Connected last, so every rule is subscribed before the first item
+        return rx.merge(*streams, keyword_routes.connect(), cue_routes.connect())
+
+    return rx.defer(build)
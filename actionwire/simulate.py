@@ -0,0 +1,167 @@
+import argparse
+from dataclasses import replace
+from datetime import datetime, timezone
+import time
+
+from reactivex.scheduler import HistoricalScheduler
+from reactivex.subject import Subject
+
+from actionwire import config, matching
+from actionwire.action import Action, PrintAction
+from actionwire.data_types import Detection, Match
+from actionwire.fake_devices import CommandRecorder, FakeLightController
+from actionwire.logic import create_events
+from actionwire.synchan import SynchanController, SynchanState
+from actionwire.utils import format_timecode
+
+
+class SimulatedSynchan(SynchanController):
+    """Synchan on the virtual clock: seeks publish a new state right away,
+    like the server broadcasting to its clients."""
+
+    def __init__(self, scheduler: HistoricalScheduler, recorder: CommandRecorder):
+        self.url = "simulated"
+        self.scheduler = scheduler
+        self.recorder = recorder
+        self.states: Subject[SynchanState] = Subject()
+        self.state: SynchanState | None = None
+
+    def __str__(self) -> str:
+        return "Synchan"
+
+    def publish(self, state: SynchanState):
+        self.state = state
+        self.states.on_next(state)
+
+    def seek(self, to: int):
+        self.recorder.command(self, "seek")
+        if self.state is not None:
+            self.publish(replace(self.state, currentTime=to))
+
+    def play(self):
+        self.recorder.command(self, "play")
+        if self.state is not None:
+            self.publish(replace(self.state, playing=True))
+
+    def pause(self):
+        self.recorder.command(self, "pause")
+        if self.state is not None:
+            self.publish(replace(self.state, playing=False))
+
+    def seek_and_play(self, to: int):
+        self.recorder.command(self, "seek_and_play")
+        if self.state is not None:
+            self.publish(replace(self.state, currentTime=to, playing=True))
+
+
+def play_from(
+    start: float = 0, duration: float = 20 * 60
+) -> list[tuple[float, SynchanState]]:
+    """Timeline of a show played once from `start` without interruption."""
+    return [(0.0, SynchanState(True, start, duration, False, 0.0))]
+
+
+def simulate(
+    detections: list[Detection],
+    timeline: list[tuple[float, SynchanState]],
+    conf: config.Config,
+    until: float | None = None,
+    execute: bool = True,
+    scheduler: HistoricalScheduler | None = None,
+    recorder: CommandRecorder | None = None,
+) -> list[tuple[float, Action]]:
+    """Replay a show through `create_events` in virtual time.
+
+    `timeline` holds (seconds, state) Synchan messages and `detections` the
+    recognized words, both on the clock of the show (seconds since it
+    started). A detection reaches the matcher at `start + latency`. The show
+    runs until `until`, by default the end of the last state's video.
+
+    With `execute`, actions run inline on fake lights and a simulated Synchan,
+    so seeks move the playhead like they would on stage. The fake devices
+    send their commands to `recorder`, which should read the clock of
+    `scheduler` when both are given. Returns the emitted actions with the
+    virtual time they were emitted at.
+    """
+    if scheduler is None:
+        scheduler = HistoricalScheduler(datetime.fromtimestamp(0, timezone.utc))
+    if recorder is None:
+        recorder = CommandRecorder(clock=lambda: scheduler.now.timestamp())
+    synchan = SimulatedSynchan(scheduler, recorder)
+    p_light, w_light = [
+        FakeLightController(
+            recorder,
+            name=name,
+            color=config.YELLOW,
+            brightness=config.initial_brightness,
+        )
+        for name in ("P", "W")
+    ]
+
+    automaton = matching.KeywordAutomaton(config.keywords)
+    matcher = matching.Matcher(automaton, config.match_window)
+    keywords: Subject[Match] = Subject()
+
+    def detect(_scheduler, detection: Detection):
+        match = matcher.match(detection)
+        if match is not None:
+            keywords.on_next(match)
+
+    actions: list[tuple[float, Action]] = []
+
+    def on_next(action: Action):
+        actions.append((scheduler.now.timestamp(), action))
+        if execute:
+            action.do()
+
+    subscription = create_events(
+        keywords, synchan.states, p_light, w_light, synchan, conf, scheduler
+    ).subscribe(on_next, on_error=print)
+
+    for detection in sorted(detections, key=lambda d: d.start + d.latency):
+        scheduler.schedule_absolute(
+            scheduler.to_datetime(detection.start + detection.latency),
+            detect,
+            detection,
+        )
+    for at, state in timeline:
+        scheduler.schedule_absolute(
+            scheduler.to_datetime(at), lambda _s, st: synchan.publish(st), state
+        )
+
+    if until is None:
+        at, state = timeline[-1]
+        until = at + state.duration - state.currentTime
+    scheduler.advance_to(scheduler.to_datetime(until))
+    subscription.dispose()
+    return actions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Replay the show in virtual time and print its actions"
+    )
+    parser.add_argument("-d", "--detections", help="detections.csv file")
+    parser.add_argument("--start", type=float, default=0, help="Film time at the start")
+    parser.add_argument("--duration", type=float, default=20 * 60)
+    parser.add_argument("--latency", type=float, default=0, help="Recognizer latency")
+    parser.add_argument("--quiet", action="store_true", help="Hide timecode prints")
+    args = parser.parse_args()
+
+    detections = matching.load_detections(args.detections) if args.detections else []
+    for detection in detections:
+        detection.latency = args.latency
+
+    t0 = time.perf_counter()
+    timeline = simulate(
+        detections,
+        play_from(args.start, args.duration),
+        config.load_config(config.CONFIG_PATH),
+    )
+    elapsed = time.perf_counter() - t0
+
+    for at, action in timeline:
+        if args.quiet and isinstance(action, PrintAction):
+            continue
+        print(format_timecode(at), action)
+    print(f"{len(timeline)} actions in {elapsed:.3f}s")
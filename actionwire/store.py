@@ -0,0 +1,222 @@
+import argparse
+import os
+import sys
+from threading import Lock
+import time
+from typing import Iterator, TextIO
+
+import numpy as np
+
+from actionwire import utils
+from actionwire.action import Action
+from actionwire.data_types import Detection
+
+# One fixed-width record per detection or executed action. `key` and
+# `source` are ids in the strings table of the show: the keyword and the
+# audio source of a detection, the action type and the device of an action.
+RECORD = np.dtype(
+    [
+        ("time", "<f8"),
+        ("key", "<u4"),
+        ("confidence", "<f4"),
+        ("source", "<u4"),
+    ]
+)
+
+STORE_PATH = os.getenv("STORE_PATH") or "./data/shows"
+
+
+class Strings:
+    """Append-only table of the strings referenced by records, one per line."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.names: list[str] = []
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.names = f.read().splitlines()
+        self.ids = {name: i for i, name in enumerate(self.names)}
+        self.file: TextIO | None = None
+
+    def id(self, name: str) -> int:
+        i = self.ids.get(name)
+        if i is None:
+            if self.file is None:
+                self.file = open(self.path, "a", encoding="utf-8")
+            i = self.ids[name] = len(self.names)
+            self.names.append(name)
+            self.file.write(name + "\n")
+            self.file.flush()
+        return i
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+class RecordLog:
+    """Append-only file of RECORD rows, read back as a memory-mapped array."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, "ab")
+
+    def append(self, t: float, key: int, confidence: float, source: int):
+        record = np.array([(t, key, confidence, source)], dtype=RECORD)
+        self.file.write(record.tobytes())
+        self.file.flush()
+
+    def read(self) -> np.ndarray:
+        return read_records(self.path)
+
+    def close(self):
+        self.file.close()
+
+
+def read_records(path: str) -> np.ndarray:
+    # A partial record at the end (a crash while writing) is left out
+    rows = os.path.getsize(path) // RECORD.itemsize if os.path.exists(path) else 0
+    if rows == 0:
+        return np.empty(0, dtype=RECORD)
+    return np.memmap(path, dtype=RECORD, mode="r", shape=(rows,))
+
+
+class ShowStore:
+    """Detections and executed actions of one show, in a directory.
+
+    Detection times are seconds of audio; action times are seconds since
+    the store was opened.
+    """
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.strings = Strings(os.path.join(directory, "strings.txt"))
+        self.detection_log = RecordLog(os.path.join(directory, "detections.bin"))
+        self.action_log = RecordLog(os.path.join(directory, "actions.bin"))
+        self.opened = time.monotonic()
+        self.lock = Lock()
+
+    def record_detection(self, detection: Detection, source: str = "mic"):
+        with self.lock:
+            self.detection_log.append(
+                detection.start,
+                self.strings.id(detection.word),
+                detection.confidence,
+                self.strings.id(source),
+            )
+
+    def record_action(self, action: Action):
+        device = action.device()
+        with self.lock:
+            self.action_log.append(
+                time.monotonic() - self.opened,
+                self.strings.id(type(action).__name__),
+                1.0,
+                self.strings.id(str(device) if device is not None else "log"),
+            )
+
+    def close(self):
+        with self.lock:
+            self.detection_log.close()
+            self.action_log.close()
+            self.strings.close()
+
+
+def open_show(directory: str) -> tuple[list[str], np.ndarray, np.ndarray]:
+    """Strings, detections and actions of a show, without opening it for writing."""
+    path = os.path.join(directory, "strings.txt")
+    names: list[str] = []
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            names = f.read().splitlines()
+    return (
+        names,
+        read_records(os.path.join(directory, "detections.bin")),
+        read_records(os.path.join(directory, "actions.bin")),
+    )
+
+
+def select(
+    names: list[str],
+    records: np.ndarray,
+    key: str | None = None,
+    start: float = float("-inf"),
+    end: float = float("inf"),
+) -> np.ndarray:
+    """Records of `key` (any key when None) with start <= time < end."""
+    mask = (records["time"] >= start) & (records["time"] < end)
+    if key is not None:
+        if key not in names:
+            return records[:0]
+        mask &= records["key"] == names.index(key)
+    return records[mask]
+
+
+def query(
+    root: str,
+    key: str | None = None,
+    start: float = float("-inf"),
+    end: float = float("inf"),
+    actions: bool = False,
+) -> Iterator[tuple[str, list[str], np.ndarray]]:
+    """(show, strings, records) of every show under `root` matching the query."""
+    for show in sorted(os.listdir(root)):
+        directory = os.path.join(root, show)
+        if not os.path.isdir(directory):
+            continue
+        names, detections, action_records = open_show(directory)
+        records = action_records if actions else detections
+        yield show, names, select(names, records, key, start, end)
+
+
+def to_detection(names: list[str], record: np.void) -> Detection:
+    return Detection(
+        float(record["time"]),
+        names[record["key"]],
+        # Stored as float32; drop the digits Vosk never reported
+        round(float(record["confidence"]), 6),
+    )
+
+
+def export_csv(names: list[str], records: np.ndarray, f: TextIO):
+    """Write detections in the detections.csv format."""
+    f.write("timecode,keyword,confidence\n")
+    for record in records:
+        f.write(to_detection(names, record).format_csv())
+
+
+def load_detections(directory: str) -> list[Detection]:
+    names, detections, _ = open_show(directory)
+    return [to_detection(names, record) for record in detections]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the stored shows")
+    parser.add_argument("--root", default=STORE_PATH, help="Directory of the shows")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    query_parser = sub.add_parser("query", help="Count records across shows")
+    query_parser.add_argument("key", nargs="?", help="Keyword or action type")
+    query_parser.add_argument("--from", dest="start", default=None, help="MM:SS")
+    query_parser.add_argument("--to", dest="end", default=None, help="MM:SS")
+    query_parser.add_argument("--actions", action="store_true")
+
+    export_parser = sub.add_parser("export", help="Detections of a show as CSV")
+    export_parser.add_argument("show")
+
+    args = parser.parse_args()
+
+    if args.command == "query":
+        start = utils.tc(args.start) if args.start else float("-inf")
+        end = utils.tc(args.end) if args.end else float("inf")
+        total = 0
+        for show, names, records in query(
+            args.root, args.key, start, end, args.actions
+        ):
+            total += len(records)
+            print(f"{show}: {len(records)}")
+        print(f"total: {total}")
+    elif args.command == "export":
+        names, detections, _ = open_show(os.path.join(args.root, args.show))
+        export_csv(names, detections, sys.stdout)
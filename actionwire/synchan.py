@@ -1,12 +1,21 @@
+import asyncio
+from collections import defaultdict, deque
 from dataclasses import dataclass
+from threading import Lock
+import time
+from typing import Callable
 import reactivex
+from reactivex.abc import SchedulerBase
 from reactivex.abc.observer import ObserverBase
+from reactivex.disposable import CompositeDisposable, SerialDisposable
 from reactivex.observable import Observable
 import reactivex.operators as ops
 import requests
+from requests.adapters import HTTPAdapter
 import socketio
 
 from actionwire import config
+from actionwire.utils import TimecodeIndex
 
 
 @dataclass
@@ -18,22 +27,104 @@ class SynchanState:
     latency: float
 
 
+class Playhead:
+    """Playhead position interpolated between Synchan control messages.
+
+    The position is the last reported `currentTime`, plus the reported
+    `latency` (seconds the message took to reach us), plus the time elapsed
+    on a monotonic clock since the message arrived while playing.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic) -> None:
+        self.clock = clock
+        self.state: SynchanState | None = None
+        self.received: float = 0.0
+
+    def update(self, state: SynchanState):
+        if state is self.state:
+            return
+        self.state = state
+        self.received = self.clock()
+
+    def position(self) -> float | None:
+        state = self.state
+        if state is None:
+            return None
+        if not state.playing:
+            return state.currentTime
+        t = state.currentTime + state.latency + self.clock() - self.received
+        if state.loop and state.duration > 0:
+            t %= state.duration
+        return t
+
+
 class SynchanController:
+    """tRPC client for the Synchan admin API.
+
+    All calls go through one keep-alive session, so commands reuse pooled
+    TCP connections. The duration of every call is kept in `latencies`.
+    """
+
     headers: dict[str, str] = {"Content-Type": "application/json"}
 
-    def __init__(self, url: str) -> None:
+    def __init__(self, url: str, timeout: float = 2.0, history: int = 1000) -> None:
         self.url: str = url
+        self.timeout: float = timeout
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        self.session.mount(self.url, HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        self.latencies: dict[str, deque[float]] = defaultdict(
+            lambda: deque(maxlen=history)
+        )
+
+    def _post(
+        self, procedure: str, data: str | None = None, params: dict | None = None
+    ) -> requests.Response:
+        start = time.perf_counter()
+        try:
+            return self.session.post(
+                f"{self.url}/trpc/{procedure}",
+                data=data,
+                params=params,
+                timeout=self.timeout,
+            )
+        finally:
+            self.latencies[procedure].append(time.perf_counter() - start)
 
     def seek(self, to: int):
-        r = requests.post(
-            f"{self.url}/trpc/admin.seek", headers=self.headers, data=str(to)
-        )
+        self._post("admin.seek", str(to))
 
     def play(self):
-        requests.post(f"{self.url}/trpc/admin.play", headers=self.headers)
+        self._post("admin.play")
 
     def pause(self):
-        requests.post(f"{self.url}/trpc/admin.pause", headers=self.headers)
+        self._post("admin.pause")
+
+    def seek_and_play(self, to: int):
+        """Seek, then play, over the pooled connection. Not a tRPC batch: the
+        server runs the procedures of a batch concurrently, so play could
+        run before seek."""
+        self.seek(to)
+        self.play()
+
+    async def seek_async(self, to: int):
+        await asyncio.to_thread(self.seek, to)
+
+    async def play_async(self):
+        await asyncio.to_thread(self.play)
+
+    async def pause_async(self):
+        await asyncio.to_thread(self.pause)
+
+    async def seek_and_play_async(self, to: int):
+        await asyncio.to_thread(self.seek_and_play, to)
+
+    def latency(self, procedure: str) -> float | None:
+        """Mean duration in seconds of the recorded calls of a procedure."""
+        samples = self.latencies.get(procedure)
+        if not samples:
+            return None
+        return sum(samples) / len(samples)
 
 
 def create_synchan(url: str) -> Observable[SynchanState]:
@@ -77,5 +168,83 @@ def create_synchan(url: str) -> Observable[SynchanState]:
     )
 
 
+def create_playhead(
+    synchan_stream: Observable[SynchanState],
+    playhead: Playhead,
+    interval: float = config.playhead_interval,
+    scheduler: SchedulerBase | None = None,
+) -> Observable[float]:
+    """Interpolated playhead position on every message and every `interval`."""
+    return reactivex.merge(
+        synchan_stream.pipe(ops.do_action(playhead.update)),
+        reactivex.interval(interval, scheduler=scheduler),
+    ).pipe(
+        ops.map(lambda _: playhead.position()),
+        ops.filter(lambda t: t is not None),
+        ops.share(),
+    )
+
+
+def create_cue_stream(
+    synchan_stream: Observable[SynchanState],
+    playhead: Playhead,
+    index: TimecodeIndex,
+    scheduler: SchedulerBase | None = None,
+) -> Observable[tuple[float, list[str]]]:
+    """Emit (start, keys) of each timecode cue at the instant the playhead
+    reaches it, instead of at the next control message.
+
+    Every message reschedules a timer to the next cue. Cues are fired once;
+    seeking back more than a cue span before the last fired cue makes the
+    earlier cues due again. Smaller steps back are clock jitter: a timer
+    may fire while the interpolated position is still just short of its cue.
+    """
+
+    def subscribe(observer: ObserverBase[tuple[float, list[str]]], _scheduler):
+        _scheduler = scheduler or _scheduler or config.thread_pool_scheduler
+        lock = Lock()
+        pending = SerialDisposable()
+        fired = float("-inf")
+
+        def schedule():
+            nonlocal fired
+            position = playhead.position()
+            if position is None or playhead.state is None:
+                return
+            if position < fired - index.span:
+                fired = float("-inf")
+            start = index.next_start(fired, position - index.span)
+            if start is None or (start > position and not playhead.state.playing):
+                pending.disposable = None
+                return
+            pending.disposable = _scheduler.schedule_relative(
+                max(start - position, 0), fire, start
+            )
+
+        def fire(_, start: float):
+            nonlocal fired
+            with lock:
+                if fired >= start:
+                    return
+                fired = start
+            # Outside the lock: a cue may seek, and the new state comes back
+            # through on_next on this thread
+            observer.on_next((start, index.at(start)))
+            with lock:
+                schedule()
+
+        def on_next(state: SynchanState):
+            with lock:
+                playhead.update(state)
+                schedule()
+
+        subscription = synchan_stream.subscribe(
+            on_next, observer.on_error, observer.on_completed
+        )
+        return CompositeDisposable(subscription, pending)
+
+    return reactivex.create(subscribe).pipe(ops.share())
+
+
 if __name__ == "__main__":
     create_synchan("http://localhost:3000").subscribe(print)
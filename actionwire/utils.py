@@ -1,5 +1,6 @@
+from bisect import bisect_left, bisect_right
 from dataclasses import dataclass
-from typing import Callable, List, TypeVar
+from typing import Callable, Dict, List, TypeVar
 
 
 def format_timecode(sec: float) -> str:
@@ -49,24 +50,58 @@ def on_off(on: Callable[[float], bool], off: Callable[[float], bool]):
 
 
 def before(t_code: str) -> Callable[[float], bool]:
-    return lambda t: t < tc(t_code)
+    end = tc(t_code)
+    return lambda t: t < end
 
 
 def after(t_code: str) -> Callable[[float], bool]:
-    return lambda t: t > tc(t_code)
+    start = tc(t_code)
+    return lambda t: t > start
 
 
 def between(start: str, end: str) -> Callable[[float], bool]:
-    return lambda t: t > tc(start) and t < tc(end)
+    s1, s2 = tc(start), tc(end)
+    return lambda t: t > s1 and t < s2
+
+
+class TimecodeIndex:
+    """Timecode cues compiled into intervals sorted by start time.
+
+    Each cue "MM:SS" is due from one to two seconds after its timecode. `due`
+    finds every cue covering a time with two bisections instead of parsing
+    and scanning the whole table.
+    """
+
+    span = 1
+
+    def __init__(self, cues: Dict[str, List[str]]):
+        intervals = sorted(
+            (tc(timecode) + 1, key)
+            for key, timecodes in cues.items()
+            for timecode in timecodes or []
+        )
+        self.starts: List[int] = [start for start, _ in intervals]
+        self.keys: List[str] = [key for _, key in intervals]
+
+    def due(self, t: float) -> List[str]:
+        lo = bisect_left(self.starts, t - self.span)
+        hi = bisect_right(self.starts, t)
+        return self.keys[lo:hi]
+
+    def at(self, start: float) -> List[str]:
+        """Keys of the cues starting exactly at `start`."""
+        lo = bisect_left(self.starts, start)
+        return self.keys[lo : bisect_right(self.starts, start, lo)]
+
+    def next_start(self, after: float, since: float) -> float | None:
+        """First cue start later than `after` and not earlier than `since`."""
+        i = max(bisect_right(self.starts, after), bisect_left(self.starts, since))
+        return self.starts[i] if i < len(self.starts) else None
+
+    def __len__(self) -> int:
+        return len(self.starts)
 
 
 def in_timecodes(timecodes: List[str]) -> Callable[[float], bool]:
-    def predicate(t: float) -> bool:
-        for timecode in timecodes:
-            s1 = tc(timecode) + 1
-            s2 = s1 + 1
-            if s1 <= t and s2 >= t:
-                return True
-        return False
-
-    return predicate
+    index = TimecodeIndex({"": timecodes})
+    return lambda t: len(index.due(t)) > 0
@@ -1,18 +1,27 @@
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import Future
 import json
-from reactivex import operators
-from reactivex.abc import ObservableBase
-from reactivex.observable import Observable
-from reactivex.operators import filter, flat_map, map
-from reactivex.scheduler import ImmediateScheduler
-from vosk import KaldiRecognizer, Model  # type: ignore
+from threading import Lock, RLock, Thread
+from typing import TYPE_CHECKING
+from reactivex.abc import SchedulerBase
+from reactivex.disposable import (
+    CompositeDisposable,
+    Disposable,
+    SingleAssignmentDisposable,
+)
+from reactivex.scheduler import TimeoutScheduler
+import numpy as np
 import reactivex as rx
-import vosk  # type: ignore
 
 from actionwire.data_types import Detection
-import config
-import mic
+from actionwire import config, metrics
+
+if TYPE_CHECKING:
+    from vosk import KaldiRecognizer, Model  # type: ignore
 
 CONFIDENCE_THRESHOLD = 0.7
+MODEL_PATH = "./data/vosk-model-small-cn-0.22"
 
 words = [
     "喝",
@@ -31,8 +40,84 @@ words = [
 ]
 
 
-def create_vosk(framerate: int):
-    model = Model(model_path="./data/vosk-model-small-cn-0.22")
+class PartialStabilizer:
+    """Turn Vosk partial hypotheses into early word results.
+
+    A word of the partial hypothesis is stable once the hypothesis up to and
+    including it stayed the same for `hits` partial results in a row. Stable
+    words that start after the end of the last emitted word are emitted, so
+    a revision of words already emitted emits nothing again. Words of the
+    final result that were already emitted (same word, close start time) are
+    dropped.
+    """
+
+    def __init__(self, hits: int = 2, tolerance: float = 0.3):
+        self.hits = hits
+        self.tolerance = tolerance
+        self.previous: list[str] = []
+        self.counts: list[int] = []
+        self.emitted: list[dict] = []
+
+    def partial(self, partial: dict) -> dict:
+        words = partial.get("partial_result", [])
+        names = [word["word"] for word in words]
+
+        same = 0
+        common = min(len(names), len(self.previous))
+        while same < common and names[same] == self.previous[same]:
+            same += 1
+        self.counts = self.counts[:same] + [0] * (len(names) - same)
+        self.counts = [count + 1 for count in self.counts]
+        self.previous = names
+
+        stable = 0
+        while stable < len(names) and self.counts[stable] >= self.hits:
+            stable += 1
+        last_end = self.emitted[-1]["end"] if self.emitted else float("-inf")
+        new_words = [word for word in words[:stable] if word["start"] >= last_end]
+        self.emitted.extend(new_words)
+        return {"result": new_words} if new_words else {}
+
+    def final(self, result: dict) -> dict:
+        pending = self.emitted
+        new_words = []
+        for word in result.get("result", []):
+            duplicate = next(
+                (
+                    emitted
+                    for emitted in pending
+                    if emitted["word"] == word["word"]
+                    and abs(emitted["start"] - word["start"]) <= self.tolerance
+                ),
+                None,
+            )
+            if duplicate is None:
+                new_words.append(word)
+            else:
+                pending.remove(duplicate)
+
+        self.previous, self.counts, self.emitted = [], [], []
+        return {**result, "result": new_words}
+
+
+_model: "Model | None" = None
+_model_lock = Lock()
+
+
+def load_model() -> "Model":
+    """The Vosk model, loaded once and shared by every recognizer."""
+    global _model
+    with _model_lock:
+        if _model is None:
+            from vosk import Model  # type: ignore
+
+            _model = Model(model_path=MODEL_PATH)
+    return _model
+
+
+def create_recognizer(model: "Model", framerate: int) -> "KaldiRecognizer":
+    from vosk import KaldiRecognizer  # type: ignore
+
     keywords = json.dumps(words, ensure_ascii=False)
     # keywords = ''
     # with open('./words.json', 'r') as f:
@@ -41,16 +126,204 @@ def create_vosk(framerate: int):
     rec = KaldiRecognizer(model, framerate, keywords)
     rec.SetWords(True)
     rec.SetMaxAlternatives(0)
+    return rec
+
+
+def accept_waveform(rec: "KaldiRecognizer", frame) -> bool:
+    """Feed a block to the recognizer. Buffers that are not bytes, like the
+    memoryviews of the microphone ring, are handed over without a copy."""
+    if not isinstance(frame, bytes):
+        from vosk import _ffi  # type: ignore
+
+        frame = _ffi.from_buffer(frame)
+    return rec.AcceptWaveform(frame)
+
+
+def prepare_recognizer(
+    framerate: int, low_latency: bool = False
+) -> "Future[KaldiRecognizer]":
+    """Load the model and warm up a recognizer on a background thread.
+
+    The recognizer decodes a short silence first, so the first real block
+    does not pay for Kaldi's lazy initialisation.
+    """
+    future: Future[KaldiRecognizer] = Future()
+
+    def run():
+        try:
+            rec = create_recognizer(load_model(), framerate)
+            if low_latency:
+                rec.SetPartialWords(True)
+            rec.AcceptWaveform(bytes(framerate // 10 * 2))
+            rec.Reset()
+            future.set_result(rec)
+        except Exception as e:
+            future.set_exception(e)
+
+    Thread(target=run, name="vosk-model", daemon=True).start()
+    return future
+
+
+class EnergyGate:
+    """Energy voice activity gate for int16 mono blocks.
+
+    A block is speech when at least `min_voiced` of its 10 ms frames have an
+    RMS above `threshold`. The gate stays open for `hangover` seconds after
+    the last speech block, which also gives Kaldi the trailing silence it
+    needs to end an utterance. While closed, the last `preroll` seconds are
+    kept and replayed when speech starts.
+    """
+
+    def __init__(
+        self,
+        framerate: int,
+        threshold: float = config.vad_threshold,
+        hangover: float = config.vad_hangover,
+        preroll: float = config.vad_preroll,
+        min_voiced: int = 3,
+    ):
+        self.frame = framerate // 100
+        self.threshold = threshold
+        self.min_voiced = min_voiced
+        self.hangover = int(hangover * framerate)
+        self.preroll_frames = int(preroll * framerate)
+        self.preroll: deque[bytes] = deque()
+        self.buffered = 0
+        self.skipped = 0
+        self.quiet = self.hangover
+        self.passed_total = 0
+        self.skipped_total = 0
+
+    def is_speech(self, samples: np.ndarray) -> bool:
+        n = len(samples) // self.frame
+        if n == 0:
+            return False
+        frames = samples[: n * self.frame].reshape(n, self.frame).astype(np.float32)
+        rms = np.sqrt(np.mean(np.square(frames), axis=1))
+        return int(np.count_nonzero(rms > self.threshold)) >= self.min_voiced
+
+    def process(self, block) -> list:
+        """Blocks to pass on for one input block. Before replaying the
+        pre-roll, the number of frames dropped since the gate closed is
+        passed on as an int, so word times can be shifted back."""
+        samples = np.frombuffer(block, dtype=np.int16)
+        if self.is_speech(samples):
+            self.quiet = 0
+        else:
+            self.quiet += len(samples)
+
+        if self.quiet < self.hangover:
+            out: list = [self.skipped] if self.skipped else []
+            out.extend(self.preroll)
+            out.append(block)
+            self.passed_total += self.buffered + len(samples)
+            self.preroll.clear()
+            self.buffered = self.skipped = 0
+            return out
+
+        # Closed: keep a copy, the block may be a view into the mic ring
+        self.preroll.append(bytes(block))
+        self.buffered += len(samples)
+        while (
+            self.preroll
+            and self.buffered - len(self.preroll[0]) // 2 >= self.preroll_frames
+        ):
+            dropped = len(self.preroll.popleft()) // 2
+            self.buffered -= dropped
+            self.skipped += dropped
+            self.skipped_total += dropped
+        return []
+
+
+def create_vad(framerate: int, **kwargs):
+    """Drop non-speech blocks in front of `create_vosk` (see `EnergyGate`)."""
+
+    def _vad(source: rx.Observable[bytes]):
+        def subscribe(observer: rx.Observer[object], scheduler):
+            gate = EnergyGate(framerate, **kwargs)
+
+            def on_next(block):
+                for item in gate.process(block):
+                    observer.on_next(item)
+
+            return source.subscribe(
+                on_next,
+                on_completed=observer.on_completed,
+                on_error=observer.on_error,
+                scheduler=scheduler,
+            )
+
+        return rx.create(subscribe)
+
+    return _vad
+
+
+def create_vosk(
+    framerate: int,
+    low_latency: bool = False,
+    recognizer: "Future[KaldiRecognizer] | None" = None,
+):
+    """Recognize audio blocks into Vosk results.
+
+    The recognizer is prepared in the background (see `prepare_recognizer`)
+    and only waited for when the stream is subscribed.
+
+    In low-latency mode the stable words of the partial results are emitted
+    as soon as they settle, and the final result only carries the words that
+    were not emitted yet. Every word gets a `latency`: the seconds of audio
+    fed to the recognizer after the end of the word.
+
+    An int in the source (from `create_vad`) is a number of frames that were
+    not fed; word times are shifted by the frames skipped before them.
+    """
+    ready = recognizer or prepare_recognizer(framerate, low_latency)
 
     def _vosk(source: rx.Observable[bytes]):
         def subscribe(observer: rx.Observer[object], scheduler):
-            def on_next(frame: bytes):
+            rec = ready.result()
+            stabilizer = PartialStabilizer()
+            fed = 0
+            # Frames fed and total frames skipped at each gap, in order
+            gaps_fed = [0]
+            gaps_skipped = [0]
+
+            def emit(result: dict):
+                position = fed / framerate
+
+                def shift(word: dict) -> dict:
+                    i = bisect_right(gaps_fed, word["start"] * framerate) - 1
+                    offset = gaps_skipped[i] / framerate
+                    return {
+                        **word,
+                        "start": word["start"] + offset,
+                        "end": word["end"] + offset,
+                        "latency": position - word["end"],
+                    }
+
+                metrics.recognizer_results.inc(
+                    kind="result" if "text" in result else "partial"
+                )
+                words = [shift(word) for word in result.get("result", [])]
+                observer.on_next({**result, "result": words} if words else result)
+
+            def on_next(frame: bytes | int):
+                nonlocal fed
                 # print("Received:", frame)
-                if rec.AcceptWaveform(frame):
-                    observer.on_next(json.loads(rec.Result()))
-                else:
-                    # print(rec.PartialResult())
-                    pass
+                if isinstance(frame, int):
+                    gaps_fed.append(fed)
+                    gaps_skipped.append(gaps_skipped[-1] + frame)
+                    return
+                fed += len(frame) // 2  # int16 mono
+                metrics.audio_blocks.inc()
+                with metrics.recognizer_seconds.time():
+                    accepted = accept_waveform(rec, frame)
+                if accepted:
+                    result = json.loads(rec.Result())
+                    emit(stabilizer.final(result) if low_latency else result)
+                elif low_latency:
+                    result = stabilizer.partial(json.loads(rec.PartialResult()))
+                    if result:
+                        emit(result)
 
             return source.subscribe(
                 on_next,
@@ -64,34 +337,199 @@ def create_vosk(framerate: int):
     return _vosk
 
 
-def flatten_result(match: dict) -> rx.Observable[dict]:
-    if "result" in match:
-        return rx.from_list(match["result"], scheduler=ImmediateScheduler())
-    else:
-        # Skip results without word matches (e.g. partial results)
-        return rx.empty()
+def high_confidence(result):
+    # Partial words may come without a confidence
+    return result.get("conf", 1.0) > CONFIDENCE_THRESHOLD
 
 
-def high_confidence(result):
-    return result["conf"] > CONFIDENCE_THRESHOLD
+def to_detections(result: dict) -> list[Detection]:
+    """Confidence-filtered detections of the words of one Vosk result."""
+    detections = []
+    for word in result.get("result", ()):
+        if word["word"] == "[unk]":
+            metrics.dropped_words.inc(reason="unk")
+            continue
+        conf = word.get("conf", 1.0)
+        if conf <= CONFIDENCE_THRESHOLD:
+            metrics.dropped_words.inc(reason="confidence")
+            continue
+        latency = word.get("latency", 0.0)
+        metrics.word_latency.observe(latency)
+        detections.append(
+            Detection(word["start"], word["word"], conf, latency, word.get("end"))
+        )
+    if detections:
+        metrics.detections.inc(len(detections))
+    return detections
 
 
 def create_detection_stream(source: rx.Observable[dict]) -> rx.Observable[Detection]:
-    return source.pipe(
-        flat_map(flatten_result),
-        filter(lambda result: result["word"] != "[unk]"),
-        filter(high_confidence),
-        map(
-            lambda result: Detection(
-                start=result["start"], word=result["word"], confidence=result["conf"]
+    """Turn Vosk results into detections in a single stage, without an
+    observable per result."""
+
+    def subscribe(observer: rx.Observer[Detection], scheduler):
+        def on_next(result: dict):
+            for detection in to_detections(result):
+                observer.on_next(detection)
+
+        return source.subscribe(
+            on_next,
+            on_completed=observer.on_completed,
+            on_error=observer.on_error,
+            scheduler=scheduler,
+        )
+
+    return rx.create(subscribe)
+
+
+class DetectionMerger:
+    """Merge the detections of several mics into one stream in start order.
+
+    Each detection is held for `hold` seconds, so a mic that is a little
+    behind can still slot an earlier word in front of it. The same word
+    from another mic starting within `window` seconds is a duplicate: while
+    both are held the more confident one is kept, once one has been released
+    the other is dropped.
+    """
+
+    def __init__(self, hold: float, window: float):
+        self.hold = hold
+        self.window = window
+        self.pending: list[tuple[float, int, Detection]] = []
+        self.released: deque[tuple[int, Detection]] = deque()
+
+    def _duplicate(self, source: int, held: int, a: Detection, b: Detection) -> bool:
+        return (
+            source != held
+            and a.word == b.word
+            and abs(a.start - b.start) <= self.window
+        )
+
+    def push(self, source: int, detection: Detection, now: float) -> bool:
+        """Hold a detection; False if it duplicates one of another mic."""
+        for i, (due, held, other) in enumerate(self.pending):
+            if self._duplicate(source, held, detection, other):
+                if detection.confidence > other.confidence:
+                    self.pending[i] = (due, source, detection)
+                metrics.dropped_words.inc(reason="duplicate")
+                return False
+        for held, other in self.released:
+            if self._duplicate(source, held, detection, other):
+                metrics.dropped_words.inc(reason="duplicate")
+                return False
+        self.pending.append((now + self.hold, source, detection))
+        return True
+
+    def pop(self, now: float) -> list[Detection]:
+        """Detections due at `now` and those that start before them."""
+        due = [detection.start for t, _, detection in self.pending if t <= now]
+        if not due:
+            return []
+        return self._release(max(due))
+
+    def flush(self) -> list[Detection]:
+        return self._release(float("inf"))
+
+    def _release(self, until: float) -> list[Detection]:
+        out = sorted(
+            (entry for entry in self.pending if entry[2].start <= until),
+            key=lambda entry: entry[2].start,
+        )
+        self.pending = [entry for entry in self.pending if entry[2].start > until]
+        for _, source, detection in out:
+            self.released.append((source, detection))
+        if out:
+            latest = out[-1][2].start
+            while self.released and self.released[0][1].start < latest - self.window:
+                self.released.popleft()
+        return [detection for _, _, detection in out]
+
+
+def merge_detections(
+    sources: list[rx.Observable[Detection]],
+    hold: float = config.mic_merge_hold,
+    window: float = config.mic_dedup_window,
+    scheduler: SchedulerBase | None = None,
+) -> rx.Observable[Detection]:
+    """Detections of several mics in one time-ordered stream, without the
+    words heard by more than one mic (see `DetectionMerger`).
+
+    Word times of all sources must share an origin, like mics subscribed at
+    the same time do.
+    """
+    if len(sources) == 1:
+        return sources[0]
+
+    def subscribe(observer: rx.Observer[Detection], scheduler_=None):
+        _scheduler = scheduler or scheduler_ or TimeoutScheduler.singleton()
+        merger = DetectionMerger(hold, window)
+        # Held while emitting, so releases from timers and sources stay in order
+        lock = RLock()
+        running = [len(sources)]
+        # Set once the stream completed, failed or was disposed
+        stopped = [False]
+        # Hold timers still pending, disposed with the subscription
+        timers = CompositeDisposable()
+
+        def stop():
+            with lock:
+                stopped[0] = True
+
+        def emit(detections: list[Detection]):
+            for detection in detections:
+                observer.on_next(detection)
+
+        def release(timer: SingleAssignmentDisposable):
+            with lock:
+                timers.remove(timer)
+                if not stopped[0]:
+                    emit(merger.pop(_scheduler.now.timestamp()))
+
+        def on_next(source: int, detection: Detection):
+            with lock:
+                if stopped[0]:
+                    return
+                if merger.push(source, detection, _scheduler.now.timestamp()):
+                    timer = SingleAssignmentDisposable()
+                    timers.add(timer)
+                    timer.disposable = _scheduler.schedule_relative(
+                        hold, lambda *_: release(timer)
+                    )
+
+        def on_error(error: Exception):
+            with lock:
+                if not stopped[0]:
+                    stopped[0] = True
+                    observer.on_error(error)
+
+        def on_completed():
+            with lock:
+                running[0] -= 1
+                if running[0] == 0 and not stopped[0]:
+                    stopped[0] = True
+                    emit(merger.flush())
+                    observer.on_completed()
+
+        subscriptions = [
+            source.subscribe(
+                lambda detection, i=i: on_next(i, detection),
+                on_error,
+                on_completed,
+                scheduler=scheduler_,
             )
-        ),
-    )
+            for i, source in enumerate(sources)
+        ]
+        return CompositeDisposable([Disposable(stop), timers, *subscriptions])
+
+    return rx.create(subscribe)
 
 
 if __name__ == "__main__":
+    from actionwire import mic, resample
+
     vosk_stream = mic.mic_stream.pipe(
-        create_vosk(config.samplerate),
+        resample.create_resampler(config.samplerate),
+        create_vosk(config.model_samplerate),
     )
 
     create_detection_stream(vosk_stream).subscribe(print)
@@ -21,6 +21,10 @@ import argparse
 import sys
 from pathlib import Path
 
+import numpy as np
+
+from actionwire.compare import ANY_KEYWORD, ScriptEntry, ScriptIndex
+
 
 def parse_timecode(timecode_str):
     """Convert timecode string (MM:SS) to seconds for easier comparison."""
@@ -91,20 +95,6 @@ def load_script(file_path):
     return script
 
 
-def find_closest_match(target_seconds, source_list, tolerance=5):
-    """Find the closest match within tolerance seconds."""
-    closest = None
-    min_diff = float('inf')
-
-    for item in source_list:
-        diff = abs(item['seconds'] - target_seconds)
-        if diff <= tolerance and diff < min_diff:
-            min_diff = diff
-            closest = item
-
-    return closest, min_diff
-
-
 def compare_files(detections, script):
     """Compare the two CSV files and generate analysis."""
 
@@ -159,14 +149,20 @@ def compare_files(detections, script):
     detections_without_match = []
     script_without_match = []
 
-    # Find matches for detections
-    for det in detections:
-        closest, diff = find_closest_match(det['seconds'], script, tolerance=10)
-        if closest:
+    # Find matches for detections: closest script entry of any keyword
+    index = ScriptIndex(
+        ScriptEntry(s['timecode'], s['keyword'], s['event'], s['action'])
+        for s in script
+    )
+    ids, diffs = index.match(
+        ANY_KEYWORD, np.array([d['seconds'] for d in detections]), tolerance=10
+    )
+    for det, script_id, diff in zip(detections, ids, diffs):
+        if script_id >= 0:
             matches.append({
                 'detection': det,
-                'script': closest,
-                'time_diff': diff
+                'script': script[script_id],
+                'time_diff': int(diff)
             })
         else:
             detections_without_match.append(det)
@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta, timezone
+import threading
+
+import numpy as np
+import pytest
+from reactivex.scheduler import HistoricalScheduler
+
+from actionwire import config, effect
+from actionwire.effect import EffectEngine
+from actionwire.light import AbsLightController
+
+
+def test_curve_samples_keyframes_at_fps():
+    values = effect.curve([(0, 0), (0.5, 1), (1, 1)], fps=10)
+    assert len(values) == 11
+    assert values[:6] == pytest.approx([0, 0.2, 0.4, 0.6, 0.8, 1])
+    assert values[6:] == pytest.approx([1] * 5)
+
+
+def test_blend_goes_the_short_way_around_the_hue_circle():
+    under = np.array([65000.0, 65535, 40000, 3500])
+    target = np.array([500.0, effect.UNDRIVEN, 20000, effect.UNDRIVEN])
+    mixed = effect.blend(under, target, 0.5)
+    assert mixed == pytest.approx([65518, 65535, 30000, 3500])
+
+    # Past 0 the other way round
+    assert effect.blend(target.copy(), under, 0.5)[0] == pytest.approx(65518)
+
+
+@pytest.mark.parametrize(
+    "built, frames",
+    [
+        (effect.flash(config.YELLOW, 1, transition=0.2, fps=20), 25),
+        (effect.fade(20000, 1, fps=20), 21),
+        (effect.pulse(config.MAX_BRIGHTNESS, 0.5, count=2, fps=20), 21),
+        (effect.crossfade(config.BLUE, 1, fps=20), 21),
+    ],
+)
+def test_effect_lengths(built, frames):
+    assert len(built) == frames
+    assert built.targets.shape == (frames, 4)
+    assert built.weights[0] == pytest.approx(0)
+
+
+def test_frame_blends_overlapping_effects_and_commits_them():
+    scheduler = HistoricalScheduler(datetime.fromtimestamp(0, timezone.utc))
+    engine = EffectEngine(scheduler, fps=10)
+    controller = AbsLightController(color=config.YELLOW, brightness=40000)
+    start = scheduler.now
+
+    engine.play(controller, effect.fade(20000, 1, fps=10))
+    scheduler.sleep(timedelta(seconds=0.5))
+    engine.play(controller, effect.crossfade(config.BLUE, 1, fps=10))
+    assert controller.animated
+
+    # Fade done, crossfade half way: hue goes down from YELLOW through 0
+    writes, finished = engine.frame(start + timedelta(seconds=1))
+    assert writes == [(controller, [59085, 65535, 20000, 3500])]
+    assert not finished
+    # Nothing changed since the last frame sent
+    assert engine.frame(start + timedelta(seconds=1)) == ([], [])
+
+    engine.frame(start + timedelta(seconds=1.1))
+    assert controller.color.code() == [9000, 65535, 20000, 3500]
+
+    writes, finished = engine.frame(start + timedelta(seconds=1.6))
+    assert finished == [controller]
+    assert controller.color.code() == [43634, 65535, 20000, 3500]
+    assert not controller.animated
+    assert not engine.playing
+
+
+def test_commit_waits_for_the_controller_lock():
+    scheduler = HistoricalScheduler(datetime.fromtimestamp(0, timezone.utc))
+    engine = EffectEngine(scheduler, fps=10)
+    controller = AbsLightController(color=config.YELLOW, brightness=40000)
+    engine.play(controller, effect.fade(20000, 0.1, fps=10))
+
+    with controller.lock:  # An action of the device queue is updating it
+        thread = threading.Thread(
+            target=engine.frame, args=(scheduler.now + timedelta(seconds=1),)
+        )
+        thread.start()
+        thread.join(0.2)
+        assert thread.is_alive()
+        controller.set_brightness(60000)
+    thread.join(1)
+    assert controller.color.brightness == 20000
@@ -0,0 +1,82 @@
+import threading
+import time
+
+import pytest
+
+from actionwire import config, light
+from actionwire.light import AbsLightController, GroupLightController
+
+
+class Bulb(AbsLightController):
+    """Records its commands; `gate` holds every command until it is set."""
+
+    def __init__(self, **kwargs):
+        self.gate = threading.Event()
+        self.gate.set()
+        self.started = 0
+        self.commands: list[tuple[str, list[int]]] = []
+        super().__init__(**kwargs)
+
+    def sync(self, duration: int = 0):
+        self.started += 1
+        self.gate.wait()
+        code = self.color.code()
+        self.commands.append(("sync", code))
+        self.confirmed_color = code
+
+    def show(self, code: list[int], duration: int = 0):
+        self.started += 1
+        self.gate.wait()
+        self.commands.append(("show", code))
+        self.confirmed_color = code
+
+
+@pytest.fixture
+def bulbs(monkeypatch):
+    bulbs = {addr: Bulb() for addr in ("a", "b")}
+    monkeypatch.setattr(
+        light, "LifxLightController", lambda addr, timeout, **kwargs: bulbs[addr[0]]
+    )
+    return bulbs
+
+
+def group(timeout: float = 0.2) -> GroupLightController:
+    return GroupLightController(
+        [("a", ""), ("b", "")], timeout=timeout, color=config.YELLOW
+    )
+
+
+def test_offline_bulb_does_not_hold_up_the_others(bulbs):
+    lights = group()
+    bulbs["a"].gate.clear()  # Bulb a stops answering
+
+    for brightness in (10000, 20000, 30000, 40000):
+        lights.set_brightness(brightness)
+        start = time.monotonic()
+        lights.sync()
+        assert time.monotonic() - start < 0.5
+        assert bulbs["b"].commands[-1] == ("sync", lights.color.code())
+
+    # One sync stuck on bulb a, one queued behind it, none piling up
+    assert bulbs["a"].started == 2
+    bulbs["a"].gate.set()
+    lights.syncs[bulbs["a"]].result(timeout=1)
+    assert bulbs["a"].commands[-1] == ("sync", lights.color.code())
+
+
+def test_sync_after_effect_waits_for_the_last_frame(bulbs):
+    lights = group()
+    bulbs["a"].gate.clear()  # The last frame is still on its way to bulb a
+
+    frame = config.RED.code()
+    lights.show(frame)
+    lights.sync()  # The effect ended: back to the color of the group
+
+    bulbs["a"].gate.set()
+    lights.syncs[bulbs["a"]].result(timeout=1)
+    assert bulbs["a"].commands[-2:] == [
+        ("show", frame),
+        ("sync", lights.color.code()),
+    ]
+    assert bulbs["a"].confirmed_color == lights.color.code()
+    assert not lights.frames
@@ -0,0 +1,36 @@
+import threading
+
+from actionwire.mic import BlockRingBuffer
+
+
+def test_overflow_drops_the_newest_block():
+    ring = BlockRingBuffer(4, 2)
+    assert ring.write(b"aaaa") and ring.write(b"bbbb")
+    assert not ring.write(b"cccc")
+    assert ring.overflows == 1
+    assert bytes(ring.peek()) == b"aaaa"
+
+
+def test_underflow_counts_only_a_stalled_stream():
+    ring = BlockRingBuffer(4, 2)
+    # Not started yet: waiting for the first block is normal
+    assert ring.peek(timeout=0.01) is None
+    assert ring.underflows == 0
+
+    # A block that arrives while the consumer waits is no underflow
+    ring.write(b"aaaa")
+    ring.peek()
+    ring.release()
+    timer = threading.Timer(0.05, ring.write, (b"bbbb",))
+    timer.start()
+    assert bytes(ring.peek(timeout=1)) == b"bbbb"
+    ring.release()
+    assert ring.underflows == 0
+
+    assert ring.peek(timeout=0.01) is None
+    assert ring.underflows == 1
+
+    # Nor is the end of the stream
+    ring.close()
+    assert ring.peek(timeout=1) is None
+    assert ring.underflows == 1
@@ -0,0 +1,76 @@
+import threading
+import time
+
+import pytest
+import reactivex as rx
+
+from actionwire import config, matching
+from actionwire.data_types import Detection, Match
+from actionwire.fake_devices import (
+    CommandRecorder,
+    FakeLightController,
+    FakeSynchanController,
+)
+from actionwire.logic import create_events
+from actionwire.rule import Rule
+
+
+def test_keyword_actions_before_source_completes():
+    """Matches arrive on the audio source thread, which loops inside
+    `subscribe` like the mic and file sources do: the actions of a keyword
+    must come out while the source is still running."""
+    source_done = threading.Event()
+    actions: list[tuple[bool, str, Match | None]] = []
+
+    def source(observer, scheduler):
+        observer.on_next(Detection(1.0, "自己", 0.9))
+        time.sleep(0.5)
+        source_done.set()
+        observer.on_completed()
+
+    recorder = CommandRecorder()
+    lights = [
+        FakeLightController(recorder, name=name, color=config.YELLOW)
+        for name in ("P", "W")
+    ]
+    keywords = matching.KeywordScanner(config.keywords).scan(rx.create(source))
+    create_events(
+        keywords,
+        rx.never(),
+        *lights,
+        FakeSynchanController(recorder),
+        config.Config("fake", [], [], {}, False),
+    ).subscribe(
+        lambda action: actions.append(
+            (source_done.is_set(), type(action).__name__, action.trigger)
+        )
+    )
+
+    assert source_done.wait(5)
+    time.sleep(0.1)  # Actions deferred to the end of the source come out now
+    flashes = [action for action in actions if action[1] == "FlashAction"]
+    assert flashes and not flashes[0][0]
+    assert flashes[0][2].word == "自己"
+
+
+@pytest.mark.parametrize(
+    "action",
+    [
+        {"do": "blink", "light": "p"},
+        {"do": "flash"},
+        {"do": "flash", "light": "x"},
+        {"do": "color", "light": "p", "color": "MAGENTA"},
+        {"do": "crossfade", "light": "w"},
+        {"do": "swap_color", "light": "p", "colors": ["WHITE", "TEAL"]},
+        {"do": "seek", "to": "later"},
+        {"do": "print", "txt": "typo"},
+    ],
+)
+def test_bad_action_fails_at_load(action):
+    with pytest.raises(ValueError, match="Rule 自己"):
+        Rule.from_dict({"keyword": "自己", "actions": [action]})
+
+
+def test_show_rules_load():
+    for rule in config.rules:
+        Rule.from_dict(rule)
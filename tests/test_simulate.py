@@ -0,0 +1,69 @@
+from datetime import datetime, timezone
+
+from reactivex.scheduler import HistoricalScheduler
+
+from actionwire import config
+from actionwire.data_types import Detection
+from actionwire.fake_devices import CommandRecorder
+from actionwire.simulate import play_from, simulate
+
+CONF = config.Config(
+    "fake",
+    [],
+    [],
+    {"jump": ["00:10"]},
+    True,
+    rules=[
+        {"keyword": "自己", "actions": [{"do": "flash", "light": "p", "length": 0.4}]},
+        {
+            "keyword": "喝茶",
+            "windows": [["00:05", None]],
+            "actions": [
+                {"do": "seek", "to": "00:24"},
+                {"do": "brightness", "light": "w", "steps": 1},
+                {"do": "seek", "to": "back", "delay": 2},
+            ],
+        },
+        # A cue that seeks, answered right away by the simulated Synchan
+        {"timecode": "jump", "actions": [{"do": "seek", "to": "00:30"}]},
+    ],
+)
+DETECTIONS = [Detection(2.0, "自己", 0.9), Detection(6.0, "喝茶", 0.9)]
+
+
+def replay():
+    scheduler = HistoricalScheduler(datetime.fromtimestamp(0, timezone.utc))
+    recorder = CommandRecorder(clock=lambda: scheduler.now.timestamp())
+    actions = simulate(
+        DETECTIONS,
+        play_from(0, 40),
+        CONF,
+        until=20,
+        scheduler=scheduler,
+        recorder=recorder,
+    )
+    return [(round(at, 3), str(action)) for at, action in actions], [
+        (round(at, 3), device, name) for at, device, name in recorder.commands
+    ]
+
+
+def test_replay_timeline():
+    _, commands = replay()
+    frames = [at for at, device, name in commands if name == "show"]
+    assert frames and all(2.0 <= at < 2.65 for at in frames)
+    assert [command for command in commands if command[2] != "show"] == [
+        (0.0, "P", "sync"),
+        (0.0, "W", "sync"),
+        (2.65, "P", "sync"),  # The flash ended
+        (6.0, "Synchan", "seek_and_play"),  # 喝茶: to 00:24
+        (6.0, "P", "sync"),  # Past 00:09, P turns on
+        (6.0, "W", "sync"),
+        (8.0, "Synchan", "seek_and_play"),  # Back to where 喝茶 was heard
+        (11.2, "P", "sync"),
+        (13.1, "Synchan", "seek_and_play"),  # The cue at 00:10 of the film
+        (14.2, "W", "sync"),
+    ]
+
+
+def test_replay_is_deterministic():
+    assert replay() == replay()
@@ -0,0 +1,43 @@
+from datetime import datetime, timezone
+
+from reactivex.scheduler import HistoricalScheduler
+from reactivex.subject import Subject
+
+from actionwire.synchan import (
+    Playhead,
+    SynchanController,
+    SynchanState,
+    create_cue_stream,
+)
+from actionwire.utils import TimecodeIndex
+
+
+def test_cue_that_seeks_does_not_deadlock():
+    scheduler = HistoricalScheduler(datetime.fromtimestamp(0, timezone.utc))
+    states: Subject[SynchanState] = Subject()
+    playhead = Playhead(clock=lambda: scheduler.now.timestamp())
+    index = TimecodeIndex({"a": ["00:05"], "b": ["00:20"]})
+    cues: list[tuple[float, float]] = []
+
+    def on_cue(cue):
+        cues.append((scheduler.now.timestamp(), cue[0]))
+        if cue[1] == ["a"]:
+            # Like a rule seeking, with Synchan answering right away
+            states.on_next(SynchanState(True, 19, 60, False, 0))
+
+    create_cue_stream(states, playhead, index, scheduler).subscribe(on_cue)
+    states.on_next(SynchanState(True, 0, 60, False, 0))
+    scheduler.advance_by(10)
+
+    assert cues == [(6, 6), (8, 21)]
+
+
+def test_seek_and_play_seeks_first():
+    controller = SynchanController("http://synchan")
+    calls: list[tuple[str, str | None]] = []
+    controller.session.post = lambda url, data=None, **kwargs: calls.append(
+        (url.rsplit("/", 1)[-1], data)
+    )
+
+    controller.seek_and_play(24)
+    assert calls == [("admin.seek", "24"), ("admin.play", None)]
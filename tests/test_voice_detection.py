@@ -0,0 +1,100 @@
+from datetime import datetime, timezone
+
+from reactivex.scheduler import HistoricalScheduler
+from reactivex.subject import Subject
+
+from actionwire.data_types import Detection
+from actionwire.voice_detection import PartialStabilizer, merge_detections
+
+
+class CountingScheduler(HistoricalScheduler):
+    """Counts the timers that run."""
+
+    def __init__(self):
+        super().__init__(datetime.fromtimestamp(0, timezone.utc))
+        self.fired = 0
+
+    def schedule_relative(self, duetime, action, state=None):
+        def run(scheduler, state):
+            self.fired += 1
+            return action(scheduler, state)
+
+        return super().schedule_relative(duetime, run, state)
+
+
+def merged(scheduler: HistoricalScheduler):
+    sources: list[Subject[Detection]] = [Subject(), Subject()]
+    out: list[str] = []
+    subscription = merge_detections(sources, 1, 0.5, scheduler).subscribe(
+        lambda detection: out.append(detection.word),
+        on_completed=lambda: out.append("completed"),
+    )
+    return sources, out, subscription
+
+
+def test_merge_orders_and_deduplicates_across_mics():
+    scheduler = HistoricalScheduler(datetime.fromtimestamp(0, timezone.utc))
+    sources, out, _ = merged(scheduler)
+    sources[0].on_next(Detection(2.0, "醒来", 0.8))
+    sources[1].on_next(Detection(1.0, "自己", 0.9))
+    sources[1].on_next(Detection(2.1, "醒来", 0.9))
+    scheduler.advance_by(2)
+    assert out == ["自己", "醒来"]
+
+
+def test_hold_timers_end_with_the_subscription():
+    scheduler = CountingScheduler()
+    sources, out, subscription = merged(scheduler)
+    sources[0].on_next(Detection(1.0, "自己", 0.9))
+    subscription.dispose()
+    scheduler.advance_by(2)
+    assert scheduler.fired == 0
+    assert out == []
+
+
+def test_nothing_after_completion():
+    scheduler = HistoricalScheduler(datetime.fromtimestamp(0, timezone.utc))
+    sources, out, _ = merged(scheduler)
+    sources[0].on_next(Detection(1.0, "自己", 0.9))
+    for source in sources:
+        source.on_completed()
+    scheduler.advance_by(2)
+    assert out == ["自己", "completed"]
+
+
+def partial(*words: tuple[str, float, float]) -> dict:
+    return {
+        "partial_result": [
+            {"word": word, "start": start, "end": end, "conf": 1.0}
+            for word, start, end in words
+        ]
+    }
+
+
+def stabilize(stabilizer: PartialStabilizer, *words) -> list[str]:
+    """Words emitted while the same hypothesis comes `hits` times."""
+    return [
+        word["word"]
+        for _ in range(stabilizer.hits)
+        for word in stabilizer.partial(partial(*words)).get("result", [])
+    ]
+
+
+def test_stabilizer_emits_stable_words_once():
+    stabilizer = PartialStabilizer(hits=2)
+    assert stabilizer.partial(partial(("自己", 0, 0.5))) == {}
+    assert stabilize(stabilizer, ("自己", 0, 0.5)) == ["自己"]
+    assert stabilize(stabilizer, ("自己", 0, 0.5), ("醒来", 0.6, 1)) == ["醒来"]
+
+
+def test_stabilizer_after_a_revision_of_emitted_words():
+    stabilizer = PartialStabilizer(hits=2)
+    assert stabilize(stabilizer, ("喝茶", 0, 0.6)) == ["喝茶"]
+
+    # An emitted word split in two: only the word after it is new
+    assert stabilize(
+        stabilizer, ("喝", 0, 0.3), ("茶", 0.3, 0.6), ("自己", 0.7, 1.2)
+    ) == ["自己"]
+
+    # Emitted words dropped from the hypothesis: the next word still comes out
+    assert stabilize(stabilizer, ("自己", 0.7, 1.2), ("醒来", 1.3, 1.8)) == ["醒来"]